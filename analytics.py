@@ -0,0 +1,178 @@
+"""Sleep analytics over long ranges: efficiency, latency, WASO, mid-sleep and regularity.
+
+A range's segments are loaded in one query and laid out as minute
+occupancy matrices (days x 1440). Rows run noon to noon (column 0 = 12:00,
+720 = 0:00), so a night that crosses midnight is one contiguous run in
+its day's row. All metrics are computed on the matrices at once; rolling
+7/30-day means come from pandas.
+
+Per day (NaN where the day has no log, or the metric has nothing to measure):
+    time_in_bed  In-bed minutes
+    total_sleep  Deep + Doze minutes (Awake excluded), in bed or not
+    efficiency   sleep in bed / time in bed
+    latency      first In-bed minute -> first sleep in bed (minutes)
+    waso         awake minutes in bed between sleep onset and final wake
+    mid_sleep    midpoint of sleep onset and final wake (minute of day, clock time)
+    sri          Sleep Regularity Index vs. the previous day (-100..100)
+
+Usage:
+    python analytics.py --user USERNAME --start YYYY-MM-DD --end YYYY-MM-DD [--out FILE.csv]
+"""
+import argparse
+from collections import namedtuple
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from models import MINUTES_PER_DAY, SessionLocal, SleepLog, SleepSegment, User
+from intervals import KIND_IN_BED, KIND_AWAKE, SLEEP_KINDS, segment_kind
+
+ROLLING_WINDOWS = (7, 30)
+METRICS = ['time_in_bed', 'total_sleep', 'efficiency', 'latency', 'waso', 'mid_sleep', 'sri']
+
+# Occupancy bits
+BED, SLEEP = 1, 2
+NOON = MINUTES_PER_DAY // 2
+
+# Parallel arrays, one entry per segment; day: row index from start_date
+SegmentArrays = namedtuple('SegmentArrays', ['n_days', 'logged', 'day', 'kind', 'start_min', 'end_min'])
+
+
+def load_segments(db, user_id, start_date, end_date):
+    """SegmentArrays of a user's [start_date, end_date] from one query (logs outer-joined to segments)"""
+    rows = db.execute(
+        select(SleepLog.date, SleepSegment.segment_type, SleepSegment.start_min, SleepSegment.end_min)
+        .outerjoin(SleepSegment, SleepSegment.log_id == SleepLog.id)
+        .where(SleepLog.user_id == user_id, SleepLog.date >= start_date, SleepLog.date <= end_date)
+    ).all()
+    n_days = (end_date - start_date).days + 1
+
+    dates = np.array([row[0] for row in rows], dtype='datetime64[D]')
+    day = (dates - np.datetime64(start_date, 'D')).astype(np.int64)
+    logged = np.zeros(n_days, dtype=bool)
+    logged[day] = True
+
+    # Keep segments with usable times; classify each distinct label once (-1: unknown)
+    codes = {}
+    for label in set(row[1] for row in rows if row[1] is not None):
+        kind = segment_kind(label)
+        codes[label] = -1 if kind is None else kind
+    keep = [i for i, row in enumerate(rows) if row[1] is not None and row[2] is not None and row[3] is not None]
+    return SegmentArrays(
+        n_days=n_days,
+        logged=logged,
+        day=day[keep],
+        kind=np.array([codes[rows[i][1]] for i in keep], dtype=np.int8),
+        start_min=np.array([rows[i][2] for i in keep], dtype=np.int64),
+        end_min=np.array([rows[i][3] for i in keep], dtype=np.int64),
+    )
+
+
+def _coverage(n_days, day, start, end):
+    """Boolean days x 1440 matrix of [start, end) noon-axis pieces (difference array + cumsum)"""
+    diff = np.zeros((n_days, MINUTES_PER_DAY + 1), dtype=np.int16)
+    np.add.at(diff, (day, start), 1)
+    np.add.at(diff, (day, end), -1)
+    return np.cumsum(diff[:, :MINUTES_PER_DAY], axis=1, dtype=np.int16) > 0
+
+
+def occupancy_matrix(segments):
+    """int8 days x 1440 matrix of BED | SLEEP bits on the noon-to-noon axis"""
+    seg = segments
+    usable = seg.start_min != seg.end_min
+    day, kind = seg.day[usable], seg.kind[usable]
+    # Clock minutes -> noon axis; pieces wrapping past noon are split
+    start = (seg.start_min[usable] - NOON) % MINUTES_PER_DAY
+    end = (seg.end_min[usable] - NOON) % MINUTES_PER_DAY
+    wrap = end < start
+    piece_day = np.concatenate([day, day[wrap]])
+    piece_kind = np.concatenate([kind, kind[wrap]])
+    piece_start = np.concatenate([start, np.zeros(wrap.sum(), dtype=np.int64)])
+    piece_end = np.concatenate([np.where(wrap, MINUTES_PER_DAY, end), end[wrap]])
+
+    def layer(mask):
+        return _coverage(seg.n_days, piece_day[mask], piece_start[mask], piece_end[mask])
+
+    in_bed = layer(piece_kind == KIND_IN_BED)
+    asleep = layer(np.isin(piece_kind, SLEEP_KINDS)) & ~layer(piece_kind == KIND_AWAKE)
+    return (in_bed * BED | asleep * SLEEP).astype(np.int8)
+
+
+def daily_metrics(occupancy, logged):
+    """{metric: float array per day} (METRICS) from an occupancy matrix"""
+    bed = (occupancy & BED) > 0
+    asleep = (occupancy & SLEEP) > 0
+    sleep_in_bed = bed & asleep
+    rows = np.arange(len(occupancy))
+
+    has_bed = logged & bed.any(axis=1)
+    has_sleep = logged & sleep_in_bed.any(axis=1)
+    time_in_bed = bed.sum(axis=1)
+    sleep_in_bed_min = sleep_in_bed.sum(axis=1)
+
+    bed_start = bed.argmax(axis=1)
+    onset = sleep_in_bed.argmax(axis=1)
+    final_wake = MINUTES_PER_DAY - sleep_in_bed[:, ::-1].argmax(axis=1)
+    # Awake-in-bed minutes between onset and final wake, from row prefix sums
+    awake_prefix = np.zeros((len(occupancy), MINUTES_PER_DAY + 1), dtype=np.int16)
+    np.cumsum(bed & ~asleep, axis=1, dtype=np.int16, out=awake_prefix[:, 1:])
+    waso = awake_prefix[rows, final_wake] - awake_prefix[rows, onset]
+
+    # SRI: share of minutes in the same sleep/wake state 24h apart (next row, same column)
+    sri = np.full(len(occupancy), np.nan)
+    if len(occupancy) > 1:
+        same = (asleep[1:] == asleep[:-1]).mean(axis=1)
+        sri[1:] = np.where(logged[1:] & logged[:-1], 200 * same - 100, np.nan)
+
+    def where(mask, values):
+        return np.where(mask, values, np.nan)
+
+    return {
+        'time_in_bed': where(logged, time_in_bed),
+        'total_sleep': where(logged, asleep.sum(axis=1)),
+        'efficiency': where(has_bed, sleep_in_bed_min / np.maximum(time_in_bed, 1)),
+        'latency': where(has_sleep, onset - bed_start),
+        'waso': where(has_sleep, waso),
+        'mid_sleep': where(has_sleep, (onset + final_wake) / 2), # Noon axis
+        'sri': sri,
+    }
+
+
+def metrics_frame(start_date, metrics, windows=ROLLING_WINDOWS):
+    """DataFrame indexed by date: daily METRICS plus <metric>_<n>d rolling means"""
+    frame = pd.DataFrame(metrics, columns=METRICS,
+                         index=pd.date_range(start_date, periods=len(metrics['sri']), name='date'))
+    for window in windows:
+        # At least half the window has to have data
+        rolled = frame[METRICS].rolling(window, min_periods=window // 2 + 1).mean()
+        frame = frame.join(rolled.add_suffix(f"_{window}d"))
+    # Mid-sleep is averaged on the noon axis (continuous across midnight), shown as clock time
+    for column in [c for c in frame.columns if c.startswith('mid_sleep')]:
+        frame[column] = (frame[column] + NOON) % MINUTES_PER_DAY
+    return frame
+
+
+def sleep_metrics(db, user_id, start_date, end_date, windows=ROLLING_WINDOWS):
+    """Daily and rolling metrics of a user's [start_date, end_date] (see module docstring)"""
+    segments = load_segments(db, user_id, start_date, end_date)
+    metrics = daily_metrics(occupancy_matrix(segments), segments.logged)
+    return metrics_frame(start_date, metrics, windows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Daily and rolling sleep metrics of a user")
+    parser.add_argument("--user", default="user1", help="username (default user1)")
+    parser.add_argument("--start", type=date.fromisoformat, default=date.today() - timedelta(days=364))
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--out", help="write CSV here (default: print the last rows)")
+    args = parser.parse_args()
+
+    with SessionLocal() as db:
+        user = db.query(User).filter(User.username == args.user).first()
+        if not user:
+            raise SystemExit(f"User not found: {args.user}")
+        frame = sleep_metrics(db, user.id, args.start, args.end)
+    if args.out:
+        frame.to_csv(args.out, float_format="%.3f")
+    else:
+        print(frame.tail(14).round(2).to_string())
@@ -0,0 +1,275 @@
+"""HTTP API (spec_api.md) on the same models / repository / PDF export as app.py.
+
+Run:
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+Every endpoint uses HTTP Basic auth against the users of the Streamlit
+auth config (AUTH_CONFIG, default auth_config.yaml) and only sees that
+user's logs. Day bodies use the JSON Lines day shape of data_io.py:
+    {"date": "2026-02-01", "sleepiness": 5, "toilet_count": 1, "memo": "",
+     "segments": [{"type": "Deep Sleep (ぐっすり)", "start": "23:00", "end": "06:00"}],
+     "events": [{"type": "toilet (トイレ)", "time": "03:00"}]}
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import date
+from functools import lru_cache
+from typing import Literal, Optional
+
+import bcrypt
+import yaml
+from fastapi import Body, Depends, FastAPI, HTTPException, Query
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from pydantic import BaseModel
+
+from models import init_db, SessionLocal, User, hhmm_to_minutes
+from repository import SleepRepository, ensure_user
+from summary import summarize_log, day_status, period_summary
+from data_io import day_dict, parse_day
+from validation import ERROR, WARNING, validate_day, message
+from month_cache import month_bounds
+from export import PDF_MAX_DAYS, range_payloads, iter_render_payloads, iter_zip, user_header, zip_file_name
+
+AUTH_CONFIG = os.getenv('AUTH_CONFIG', 'auth_config.yaml')
+# Longest period /logs/summary aggregates in one request (the calendar CTE has one row per day)
+SUMMARY_MAX_DAYS = int(os.getenv('SUMMARY_MAX_DAYS', 3660))
+# Years accepted by the month endpoints
+YEAR_MIN, YEAR_MAX = 1900, 9999
+
+
+@asynccontextmanager
+async def lifespan(app):
+    init_db()
+    yield
+
+
+app = FastAPI(title="Sleep Monitor API", lifespan=lifespan)
+
+
+# --- Errors: 400 with keys + messages (spec_api.md) ---
+
+def _bad_request(errors):
+    """errors: [(key, message)]"""
+    return HTTPException(400, detail=[{'key': key, 'message': message} for key, message in errors])
+
+
+@app.exception_handler(RequestValidationError)
+async def _validation_error(request, exc):
+    return JSONResponse(status_code=400, content={'detail': [
+        {'key': ".".join(str(part) for part in e['loc'] if part != 'body'), 'message': e['msg']}
+        for e in exc.errors()
+    ]})
+
+
+# --- Auth ---
+
+@lru_cache(maxsize=1)
+def _load_credentials(path, mtime):
+    with open(path) as file:
+        return yaml.safe_load(file)['credentials']['usernames']
+
+
+def _credentials():
+    """credentials.usernames of the auth config, re-read when the file changes"""
+    return _load_credentials(AUTH_CONFIG, os.path.getmtime(AUTH_CONFIG))
+
+
+# Credentials already checked with bcrypt, so clients repeating the same
+# Basic header don't pay a bcrypt round (~0.25 s) per request. Entries are
+# HMACs under a per-process random key (not crackable offline copies of the
+# passwords), kept LRU with a TTL so old passwords are forgotten.
+VERIFIED_CACHE_SIZE = int(os.getenv('VERIFIED_CACHE_SIZE', 1024))
+VERIFIED_CACHE_TTL = int(os.getenv('VERIFIED_CACHE_TTL', 300)) # Seconds
+_verified_key = secrets.token_bytes(32)
+_verified = OrderedDict() # HMAC digest -> verified at (monotonic)
+_verified_lock = threading.Lock()
+
+
+def _check_password(username, password, stored):
+    key = hmac.new(_verified_key, "\0".join((username, stored, password)).encode(), hashlib.sha256).digest()
+    now = time.monotonic()
+    with _verified_lock:
+        verified_at = _verified.get(key)
+        if verified_at is not None and now - verified_at < VERIFIED_CACHE_TTL:
+            _verified.move_to_end(key)
+            return True
+        _verified.pop(key, None)
+    if stored.startswith("$2"):
+        ok = bcrypt.checkpw(password.encode(), stored.encode())
+    else:
+        # Plain-text entry (streamlit-authenticator hashes these itself)
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+    if ok:
+        with _verified_lock:
+            _verified[key] = now
+            while len(_verified) > VERIFIED_CACHE_SIZE:
+                _verified.popitem(last=False)
+    return ok
+
+
+def get_db():
+    # One pooled session per request (engine pool settings: models.py)
+    with SessionLocal() as db:
+        yield db
+
+
+security = HTTPBasic()
+
+
+def get_repo(credentials: HTTPBasicCredentials = Depends(security), db=Depends(get_db)):
+    """The authenticated user's repository (401 on bad credentials)"""
+    creds = _credentials().get(credentials.username)
+    if not creds or not _check_password(credentials.username, credentials.password, str(creds.get('password', ""))):
+        raise HTTPException(401, "Invalid username or password", headers={"WWW-Authenticate": "Basic"})
+    user, _ = ensure_user(db, credentials.username, creds)
+    return SleepRepository(db, user.id)
+
+
+# --- Logs ---
+
+class Period(BaseModel):
+    start_date: date
+    end_date: date
+
+
+def _check_period(start_date, end_date, max_days=None):
+    if end_date < start_date:
+        raise _bad_request([('end_date', "end_date must not be before start_date")])
+    if max_days and (end_date - start_date).days + 1 > max_days:
+        raise _bad_request([('end_date', f"period is limited to {max_days} days")])
+
+
+def _day_response(log):
+    summary = log.summary or summarize_log(log)
+    missing = summary.missing_fields.split(",") if summary.missing_fields else []
+    issues = validate_day(log.sleepiness, log.toilet_count,
+                          [(s.segment_type, s.start_min, s.end_min) for s in log.segments], log.memo)
+    return dict(
+        day_dict(log),
+        id=log.id,
+        completion_status='complete' if summary.is_complete else 'incomplete_required_missing',
+        missing_fields=missing,
+        warnings_fields=[issue.key for issue in issues if issue.level == WARNING]
+    )
+
+
+def _parse_day_body(body):
+    day, errors = parse_day(body if isinstance(body, dict) else {'_error': "expected a JSON object"})
+    if day is None:
+        raise _bad_request([('day', error) for error in errors])
+    values, segments, _ = day
+    # Save-time errors E1-E3 block the save, like the daily-entry page
+    issues = validate_day(
+        values['sleepiness'], values['toilet_count'],
+        [(s_type, hhmm_to_minutes(start_at), hhmm_to_minutes(end_at)) for s_type, start_at, end_at in segments],
+        values['memo']
+    )
+    errors = [issue for issue in issues if issue.level == ERROR]
+    if errors:
+        raise _bad_request([(issue.key, message(issue)) for issue in errors])
+    return day
+
+
+@app.post("/logs/summary")
+def logs_summary(period: Period, repo: SleepRepository = Depends(get_repo)):
+    _check_period(period.start_date, period.end_date, SUMMARY_MAX_DAYS)
+    # One set-based query for the whole period (repository.day_statuses)
+    rows = repo.statuses(period.start_date, period.end_date)
+    return period_summary(period.start_date, period.end_date, rows)
+
+
+@app.get("/logs/month")
+def logs_month(year: int = Query(..., ge=YEAR_MIN, le=YEAR_MAX), month: int = Query(..., ge=1, le=12),
+               repo: SleepRepository = Depends(get_repo)):
+    start_date, end_date = month_bounds(year, month)
+    return {'days': [
+        {'date': row.day.isoformat(), 'status': day_status(row)}
+        for row in repo.statuses(start_date, end_date)
+    ]}
+
+
+@app.get("/logs/day")
+def get_day(day: date = Query(..., alias="date"), repo: SleepRepository = Depends(get_repo)):
+    log = repo.get(day)
+    if log is None:
+        raise HTTPException(404, f"No log for {day.isoformat()}")
+    return _day_response(log)
+
+
+@app.post("/logs/day", status_code=201)
+def create_day(body: dict = Body(...), repo: SleepRepository = Depends(get_repo)):
+    values, segments, events = _parse_day_body(body)
+    if repo.get(values['date']) is not None:
+        raise HTTPException(409, f"A log for {values['date'].isoformat()} exists; update it with PUT /logs/day/{{id}}")
+    log = repo.save(values['date'], values, segments, events)
+    repo.commit()
+    return _day_response(log)
+
+
+@app.put("/logs/day/{log_id}")
+def update_day(log_id: int, body: dict = Body(...), repo: SleepRepository = Depends(get_repo)):
+    try:
+        log = repo.get_by_id(log_id)
+    except PermissionError:
+        raise HTTPException(403, "Forbidden")
+    if log is None:
+        raise HTTPException(404, f"No log with id {log_id}")
+    values, segments, events = _parse_day_body(body)
+    if values['date'] != log.date:
+        raise _bad_request([('date', "date of an existing log cannot be changed")])
+    # Diff-based save: unchanged rows are not rewritten
+    log = repo.save(log.date, values, segments, events, log=log)
+    repo.commit()
+    return _day_response(log)
+
+
+# --- PDF (no storage) ---
+
+class PdfRequest(BaseModel):
+    mode: Literal['month', 'range']
+    year: Optional[int] = None
+    month: Optional[int] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    debug: bool = False
+
+
+def _attachment(file_name):
+    return {'Content-Disposition': f'attachment; filename="{file_name}"'}
+
+
+@app.post("/pdf/generate")
+def pdf_generate(req: PdfRequest, repo: SleepRepository = Depends(get_repo)):
+    if req.mode == 'month':
+        if req.year is None or req.month is None or not 1 <= req.month <= 12:
+            raise _bad_request([('month', "year and month (1-12) are required for mode=month")])
+        if not YEAR_MIN <= req.year <= YEAR_MAX:
+            raise _bad_request([('year', f"year must be {YEAR_MIN}-{YEAR_MAX}")])
+        start_date, end_date = month_bounds(req.year, req.month)
+    else:
+        if req.start_date is None or req.end_date is None:
+            raise _bad_request([('start_date', "start_date and end_date are required for mode=range")])
+        start_date, end_date = req.start_date, req.end_date
+        _check_period(start_date, end_date, PDF_MAX_DAYS)
+
+    header = user_header(repo.db.get(User, repo.user_id))
+    # All DB reads happen here, before the response starts streaming
+    payloads = range_payloads(repo.db, repo.user_id, start_date, end_date, header)
+    files = iter_render_payloads(payloads, debug=req.debug)
+
+    if len(payloads) == 1:
+        # Single month -> application/pdf
+        file_name, pdf_bytes = next(iter(files))
+        return Response(pdf_bytes, media_type="application/pdf", headers=_attachment(file_name))
+
+    # Cross-month -> application/zip, each month sent as soon as it is rendered
+    return StreamingResponse(iter_zip(files), media_type="application/zip",
+                             headers=_attachment(zip_file_name(start_date, end_date)))
@@ -1,13 +1,29 @@
+import io
+import os
 import streamlit as st
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
-from models import init_db, SessionLocal, User, SleepLog, SleepSegment, Event
+from models import init_db, SessionLocal, User, hhmm_to_minutes, minutes_to_hhmm
 from datetime import datetime, date, time, timedelta
-from pdf_generator import SleepPDFGenerator
+from repository import SleepRepository, ensure_user
+from month_cache import month_cache
+from summary import event_icons
+from intervals import DayIntervals, SEGMENT_TYPES, SLEEP_KINDS
+from data_io import export_days, import_days, format_for
+from validation import ERROR, MISSING, RULES, validate_day, message
+
+# Calendar page: days in the month grid (6 weeks)
+CAL_GRID_DAYS = 42
 
 # --- Initialize DB ---
-init_db()
+# Schema check (create_all + reflection) runs once per process, not on every rerun.
+# The engine itself is a module-level singleton in models.py.
+@st.cache_resource
+def _init_db_once():
+    init_db()
+
+_init_db_once()
 
 # --- Page Config ---
 st.set_page_config(page_title="Sleep Monitor", layout="wide")
@@ -16,9 +32,14 @@ st.set_page_config(page_title="Sleep Monitor", layout="wide")
 auth_file = "auth_config.yaml"
 config = None
 
+@st.cache_data
+def load_auth_config(path, mtime):
+    """Parsed auth config, cached per file version (each rerun gets its own mutable copy)"""
+    with open(path) as file:
+        return yaml.load(file, Loader=SafeLoader)
+
 try:
-    with open(auth_file) as file:
-        config = yaml.load(file, Loader=SafeLoader)
+    config = load_auth_config(auth_file, os.path.getmtime(auth_file))
 except FileNotFoundError:
     # Try fetching from secrets if file not found (Cloud Deployment)
     if "credentials" in st.secrets:
@@ -68,624 +89,600 @@ elif authentication_status:
     authenticator.logout('ログアウト', 'sidebar', key='unique_logout_key')
     st.sidebar.title(f"ようこそ、{name}さん")
     
-    # DB Session
-    db = SessionLocal()
-
-    # --- Sync Config User to DB ---
-    current_username = st.session_state.get('username')
-    if current_username:
-        user_in_db = db.query(User).filter(User.username == current_username).first()
-        if not user_in_db:
+    # DB Session: one per rerun, closed at the end of the run (also on st.rerun()/st.stop())
+    with SessionLocal() as db:
+        # --- Sync Config User to DB ---
+        current_username = st.session_state.get('username')
+        current_user_id = None
+        if current_username and st.session_state.get('state_username') == current_username:
+            # Resolved on an earlier run of this session: no query
+            current_user_id = st.session_state.get('state_user_id')
+        elif current_username:
             # Create user in DB if not exists (sync with auth_config)
             user_creds = config['credentials']['usernames'].get(current_username, {})
-            new_db_user = User(
-                username=current_username,
-                email=user_creds.get('email', f"{current_username}@example.com"),
-                password_hash=user_creds.get('password', 'stored_in_config'), # Placeholder
-                display_name=user_creds.get('name', name)
-            )
-            db.add(new_db_user)
-            db.commit()
-            st.toast(f"ユーザーデータを初期化しました: {current_username}")
+            current_user, created = ensure_user(db, current_username, user_creds, name)
+            if created:
+                st.toast(f"ユーザーデータを初期化しました: {current_username}")
+            current_user_id = current_user.id
+        
+        if current_user_id is None:
+            st.error("ユーザー情報を取得できませんでした。再度ログインしてください。")
+            st.stop()
+        
+        # All log reads/writes below go through the logged-in user's repository,
+        # reads served from the shared month cache
+        repo = SleepRepository(db, current_user_id, cache=month_cache)
+        
+        # Drop per-user page state left by a previous login in this browser session
+        if st.session_state.get('state_user_id') != current_user_id:
+            for key in ('current_date', 'segments', 'events', 'entry_notice', 'range_export', 'io_export'):
+                st.session_state.pop(key, None)
+            st.session_state.state_user_id = current_user_id
+        st.session_state.state_username = current_username
     
-    # Navigation
-    if 'current_page' not in st.session_state:
-        st.session_state.current_page = "📅 カレンダー(月次確認)"
+        # Navigation
+        if 'current_page' not in st.session_state:
+            st.session_state.current_page = "📅 カレンダー(月次確認)"
         
-    options = ["📅 カレンダー(月次確認)", "📝 日次データ入力", "📄 PDF出力", "⚙️ 設定"]
+        options = ["📅 カレンダー(月次確認)", "📝 日次データ入力", "📄 PDF出力", "⚙️ 設定"]
     
-    # Resolve index
-    try:
-        idx = options.index(st.session_state.current_page)
-    except ValueError:
-        idx = 0
-        
-    # Widget without Direct Key Binding for State
-    selected_page = st.sidebar.radio("メニュー", options, index=idx)
+        # Resolve index
+        try:
+            idx = options.index(st.session_state.current_page)
+        except ValueError:
+            idx = 0
+        
+        # Widget without Direct Key Binding for State
+        selected_page = st.sidebar.radio("メニュー", options, index=idx)
     
-    # Manual State Sync
-    if selected_page != st.session_state.current_page:
-        st.session_state.current_page = selected_page
-        st.rerun()
+        # Manual State Sync
+        if selected_page != st.session_state.current_page:
+            st.session_state.current_page = selected_page
+            st.rerun()
         
-    page = st.session_state.current_page
+        page = st.session_state.current_page
     
-    import calendar
+        import calendar
 
-    if page == "📅 カレンダー(月次確認)":
-        from streamlit_calendar import calendar
-        st.title("月次レビュー")
+        if page == "📅 カレンダー(月次確認)":
+            from streamlit_calendar import calendar
+            st.title("月次レビュー")
         
-        # Determine view date (default to today or stored state)
-        if 'cal_date' not in st.session_state:
-            st.session_state.cal_date = date.today()
+            # Determine view date (default to today or stored state)
+            if 'cal_date' not in st.session_state:
+                st.session_state.cal_date = date.today()
+            cal_month = st.session_state.cal_date.replace(day=1)
+            
+            # Month navigation lives here (not in the FullCalendar toolbar) so the app
+            # always knows the visible month and loads only what is on screen
+            nav_prev, nav_title, nav_today, nav_next = st.columns([1, 2, 1, 1])
+            if nav_prev.button("◀ 前月"):
+                st.session_state.cal_date = (cal_month - timedelta(days=1)).replace(day=1)
+                st.rerun()
+            nav_title.markdown(f"#### {cal_month.year}年{cal_month.month}月")
+            if nav_today.button("今月"):
+                st.session_state.cal_date = date.today()
+                st.rerun()
+            if nav_next.button("翌月 ▶"):
+                st.session_state.cal_date = (cal_month + timedelta(days=31)).replace(day=1)
+                st.rerun()
+            
+            # Visible grid: 6 weeks starting on the Sunday on/before the 1st
+            grid_start = cal_month - timedelta(days=(cal_month.weekday() + 1) % 7)
+            grid_end = grid_start + timedelta(days=CAL_GRID_DAYS - 1)
             
-        # Fetch data for a wider range to allow scrolling in calendar
-        # Fetching +/- 60 days from current view date
-        # Note: We use cal_date just as a reference, FullCalendar handles viewing
-        start_date = st.session_state.cal_date - timedelta(days=60)
-        end_date = st.session_state.cal_date + timedelta(days=60)
-
-        logs = db.query(SleepLog).filter(
-            SleepLog.user_id == 1,
-            SleepLog.date >= start_date,
-            SleepLog.date <= end_date
-        ).all()
-        
-        events = []
-        for log in logs:
-            # Calc Sleep Time
-            s_mins = 0
-            for s in log.segments:
-                if "Deep" in s.segment_type or "Doze" in s.segment_type:
-                    try:
-                        ts = datetime.strptime(s.start_at, "%H:%M")
-                        te = datetime.strptime(s.end_at, "%H:%M")
-                        d_s = datetime.combine(date.min, ts.time())
-                        d_e = datetime.combine(date.min, te.time())
-                        if d_e < d_s: d_e += timedelta(days=1)
-                        s_mins += (d_e - d_s).total_seconds() / 60
-                    except: pass
+            # Only the days on the grid (the component remounts per month); they come from
+            # the month cache, so a plain rerun or revisiting a month issues no queries
+            logs = repo.days(grid_start, grid_end)
+        
+            events = []
+            for log in logs:
+                # Precomputed per-day totals
+                summary = log.summary
             
-            h = int(s_mins // 60)
-            m = int(s_mins % 60)
+                h = summary.total_sleep_min // 60
+                m = summary.total_sleep_min % 60
             
-            title = f"{h}h{m}m"
-            if log.sleepiness:
-                title += f" Lv{log.sleepiness}"
+                title = f"{h}h{m}m"
+                if log.sleepiness:
+                    title += f" Lv{log.sleepiness}"
             
-            # Icons
-            if log.events:
-                evt_icons = ""
-                for e in log.events:
-                    if "alcohol" in e.event_type: evt_icons += "🍺"
-                    elif "med" in e.event_type: evt_icons += "💊"
-                    elif "caffeine" in e.event_type: evt_icons += "☕"
-                    elif "bath" in e.event_type: evt_icons += "🛁"
-                    elif "toilet" in e.event_type: evt_icons += "🚽"
-                    else: evt_icons += "•"
-                title += f" {evt_icons}"
+                # Icons
+                evt_icons = event_icons(summary)
+                if evt_icons:
+                    title += f" {evt_icons}"
                 
-            events.append({
-                "title": title,
-                "start": log.date.strftime("%Y-%m-%d"),
-                "allDay": True,
-                # Custom prop to identify date
-                "extendedProps": {"date": log.date.strftime("%Y-%m-%d")}
-            })
-
-        calendar_options = {
-            "headerToolbar": {
-                "left": "prev,next today",
-                "center": "title",
-                "right": "dayGridMonth,listMonth" 
-            },
-            "initialDate": st.session_state.cal_date.strftime("%Y-%m-%d"),
-            "navLinks": False,
-            "selectable": True,
-            "selectMirror": True,
-            "dayMaxEvents": True,
-            "contentHeight": "auto",
-        }
-        
-        # Custom CSS to make events look like badges
-        custom_css = """
-        .fc-event-title {
-            white-space: normal;
-            font-size: 0.85em;
-        }
-        .fc-toolbar-title {
-            font-size: 1.2em !important;
-        }
-        """
-
-        cal = calendar(events=events, options=calendar_options, custom_css=custom_css, key="sleep_calendar")
-        
-        # Handle Event Click
-        if cal.get("eventClick"):
-            event = cal["eventClick"]["event"]
-            # Extract date from start str (YYYY-MM-DD or ISO)
-            clicked_date_str = event["start"].split("T")[0]
-            try:
-                clicked_date = datetime.strptime(clicked_date_str, "%Y-%m-%d").date()
-                st.session_state.target_entry_date = clicked_date
-                st.session_state.current_page = "📝 日次データ入力"
-                st.rerun()
-            except ValueError:
-                pass
-        
-        # Handle Date Click (Empty cell click)
-        if cal.get("dateClick"):
-            date_click = cal["dateClick"]
-            clicked_date_str = date_click["date"].split("T")[0]
-            try:
-                clicked_date = datetime.strptime(clicked_date_str, "%Y-%m-%d").date()
-                st.session_state.target_entry_date = clicked_date
-                st.session_state.current_page = "📝 日次データ入力"
-                st.rerun()
-            except ValueError:
-                pass
+                events.append({
+                    "title": title,
+                    "start": log.date.strftime("%Y-%m-%d"),
+                    "allDay": True,
+                    # Custom prop to identify date
+                    "extendedProps": {"date": log.date.strftime("%Y-%m-%d")}
+                })
+
+            calendar_options = {
+                "headerToolbar": {
+                    "left": "",
+                    "center": "title",
+                    "right": "dayGridMonth,listMonth" 
+                },
+                "initialDate": st.session_state.cal_date.strftime("%Y-%m-%d"),
+                "navLinks": False,
+                "selectable": True,
+                "selectMirror": True,
+                "dayMaxEvents": True,
+                "contentHeight": "auto",
+            }
+        
+            # Custom CSS to make events look like badges
+            custom_css = """
+            .fc-event-title {
+                white-space: normal;
+                font-size: 0.85em;
+            }
+            .fc-toolbar-title {
+                font-size: 1.2em !important;
+            }
+            """
+
+            # Keyed per month: navigating remounts the component at the new initialDate.
+            # Only click callbacks, so mounting does not trigger an extra rerun (eventsSet).
+            cal = calendar(
+                events=events, options=calendar_options, custom_css=custom_css,
+                callbacks=["dateClick", "eventClick"],
+                key=f"sleep_calendar_{cal_month:%Y%m}"
+            )
+        
+            # Handle Event Click
+            if cal.get("eventClick"):
+                event = cal["eventClick"]["event"]
+                # Extract date from start str (YYYY-MM-DD or ISO)
+                clicked_date_str = event["start"].split("T")[0]
+                try:
+                    clicked_date = datetime.strptime(clicked_date_str, "%Y-%m-%d").date()
+                    st.session_state.target_entry_date = clicked_date
+                    st.session_state.current_page = "📝 日次データ入力"
+                    st.rerun()
+                except ValueError:
+                    pass
+        
+            # Handle Date Click (Empty cell click)
+            if cal.get("dateClick"):
+                date_click = cal["dateClick"]
+                clicked_date_str = date_click["date"].split("T")[0]
+                try:
+                    clicked_date = datetime.strptime(clicked_date_str, "%Y-%m-%d").date()
+                    st.session_state.target_entry_date = clicked_date
+                    st.session_state.current_page = "📝 日次データ入力"
+                    st.rerun()
+                except ValueError:
+                    pass
 
-        st.markdown("---")
+            st.markdown("---")
         
-    elif page == "📝 日次データ入力":
-        st.title("日次データ入力")
+        elif page == "📝 日次データ入力":
+            st.title("日次データ入力")
+            # Save-time errors / warnings banner (spec_validation.md A)
+            banner = st.container()
         
-        # 1. Date Selection
-        default_date = date.today()
-        if 'target_entry_date' in st.session_state:
-            default_date = st.session_state.target_entry_date
+            # 1. Date Selection
+            default_date = date.today()
+            if 'target_entry_date' in st.session_state:
+                default_date = st.session_state.target_entry_date
             
-        selected_date = st.date_input("日付選択", default_date)
-        
-        # Sync state if manually changed
-        if selected_date != default_date:
-            st.session_state.target_entry_date = selected_date
-        
-        # 2. Load existing data
-        existing_log = db.query(SleepLog).filter(
-            SleepLog.user_id == 1,
-            SleepLog.date == selected_date
-        ).first()
-        
-        # 3. Initialize Session State
-        if 'current_date' not in st.session_state or st.session_state.current_date != selected_date:
-            st.session_state.current_date = selected_date
-            st.session_state.segments = []
-            st.session_state.events = []
-            st.session_state.sleepiness = 5
-            st.session_state.memo = ""
-            st.session_state.toilet_count = 0
+            selected_date = st.date_input("日付選択", default_date)
+        
+            # Sync state if manually changed
+            if selected_date != default_date:
+                st.session_state.target_entry_date = selected_date
+        
+            # 2. Load existing data
+            existing_log = repo.day(selected_date) # Cached snapshot (no query on reruns)
+        
+            # 3. Initialize Session State
+            if 'current_date' not in st.session_state or st.session_state.current_date != selected_date:
+                st.session_state.current_date = selected_date
+                st.session_state.segments = DayIntervals()
+                st.session_state.events = []
+                st.session_state.sleepiness = 5
+                st.session_state.memo = ""
+                st.session_state.toilet_count = 0
+                st.session_state.pop('entry_notice', None)
             
-            if existing_log:
-                if existing_log.sleepiness: st.session_state.sleepiness = existing_log.sleepiness
-                if existing_log.memo: st.session_state.memo = existing_log.memo
-                if existing_log.toilet_count: st.session_state.toilet_count = existing_log.toilet_count
+                if existing_log:
+                    if existing_log.sleepiness: st.session_state.sleepiness = existing_log.sleepiness
+                    if existing_log.memo: st.session_state.memo = existing_log.memo
+                    if existing_log.toilet_count: st.session_state.toilet_count = existing_log.toilet_count
                 
-                # Load segments
-                for seg in existing_log.segments:
-                    try:
-                        st.session_state.segments.append({
-                            'start': datetime.strptime(seg.start_at, "%H:%M").time(),
-                            'end': datetime.strptime(seg.end_at, "%H:%M").time(),
-                            'type': seg.segment_type
-                        })
-                    except ValueError: pass
+                    # Load segments (sorted; overlapping / malformed ones end up in .rejected)
+                    st.session_state.segments = DayIntervals.from_segments(
+                        [(seg.segment_type, seg.start_min, seg.end_min) for seg in existing_log.segments]
+                    )
                     
-                # Load events
-                for evt in existing_log.events:
-                    try:
+                    # Load events
+                    for evt in existing_log.events:
+                        if evt.happened_min is None: continue
                         st.session_state.events.append({
-                            'time': datetime.strptime(evt.happened_at, "%H:%M").time(),
+                            'time': time(evt.happened_min // 60, evt.happened_min % 60),
                             'type': evt.event_type
                         })
-                    except ValueError: pass
 
-        # 5. Input Forms
-        # Helper for time selection (15 min intervals) to avoid mobile keyboard popup
-        time_options = [f"{h:02d}:{m:02d}" for h in range(24) for m in (0, 15, 30, 45)]
+            rejected = st.session_state.segments.rejected
+            if rejected:
+                banner.warning(
+                    f"保存済みの睡眠区間のうち{len(rejected)}件は読み込めませんでした（保存するとこれらは削除されます）。\n\n"
+                    + "\n".join(f"- {seg.segment_type}: {RULES[key][1]}" for seg, key in rejected)
+                )
+
+            # 5. Input Forms
+            # Helper for time selection (15 min intervals) to avoid mobile keyboard popup
+            time_options = [f"{h:02d}:{m:02d}" for h in range(24) for m in (0, 15, 30, 45)]
         
-        col1, col2 = st.columns(2)
+            col1, col2 = st.columns(2)
         
-        with col1:
-            st.subheader("睡眠区間の追加")
-            with st.form("add_segment_form", clear_on_submit=True):
-                s_type = st.selectbox("種類", ["In-bed (布団に入っている)", "Deep Sleep (ぐっすり)", "Doze (うとうと)", "Awake (眠れない)"])
+            with col1:
+                st.subheader("睡眠区間の追加")
+                with st.form("add_segment_form", clear_on_submit=True):
+                    s_type = st.selectbox("種類", SEGMENT_TYPES)
                 
-                # Use selectbox for time to improve mobile UX
-                def get_time_index(t_str):
-                    try: return time_options.index(t_str)
-                    except ValueError: return 0
+                    # Use selectbox for time to improve mobile UX
+                    def get_time_index(t_str):
+                        try: return time_options.index(t_str)
+                        except ValueError: return 0
                 
-                t_start_str = st.select_slider("開始時刻", options=time_options, value="23:00")
-                t_end_str = st.select_slider("終了時刻", options=time_options, value="07:00")
+                    t_start_str = st.select_slider("開始時刻", options=time_options, value="23:00")
+                    t_end_str = st.select_slider("終了時刻", options=time_options, value="07:00")
 
-                t_start = datetime.strptime(t_start_str, "%H:%M").time()
-                t_end = datetime.strptime(t_end_str, "%H:%M").time()
-                
-                if st.form_submit_button("区間を追加"):
-                    st.session_state.segments.append({
-                        'type': s_type,
-                        'start': t_start,
-                        'end': t_end
-                    })
-                    st.rerun()
+                    if st.form_submit_button("区間を追加"):
+                        try:
+                            # Sorted insert; overlapping / zero-length segments are refused here
+                            st.session_state.segments.insert(s_type, hhmm_to_minutes(t_start_str), hhmm_to_minutes(t_end_str))
+                        except ValueError as e:
+                            st.error(RULES[str(e)][1])
+                        else:
+                            st.rerun()
 
-        with col2:
-            st.subheader("イベントの追加")
-            with st.form("add_event_form", clear_on_submit=True):
-                e_type = st.selectbox("イベント種類", ["sleep_med (睡眠薬)", "toilet (トイレ)", "other_med (その他薬)"])
+            with col2:
+                st.subheader("イベントの追加")
+                with st.form("add_event_form", clear_on_submit=True):
+                    e_type = st.selectbox("イベント種類", ["sleep_med (睡眠薬)", "toilet (トイレ)", "other_med (その他薬)"])
                 
-                e_time_str = st.select_slider("発生時刻", options=time_options, value="22:00")
-                e_time = datetime.strptime(e_time_str, "%H:%M").time()
+                    e_time_str = st.select_slider("発生時刻", options=time_options, value="22:00")
+                    e_time = datetime.strptime(e_time_str, "%H:%M").time()
                 
-                if st.form_submit_button("イベントを追加"):
-                    st.session_state.events.append({
-                        'type': e_type,
-                        'time': e_time
-                    })
-                    st.rerun()
+                    if st.form_submit_button("イベントを追加"):
+                        st.session_state.events.append({
+                            'type': e_type,
+                            'time': e_time
+                        })
+                        st.rerun()
 
-        st.subheader("日次情報")
-        # Removed Toilet Count Input, Keep Sleepiness and Memo
-        st.session_state.sleepiness = st.slider("起床時の眠気 (1-10)", 1, 10, st.session_state.sleepiness)
+            st.subheader("日次情報")
+            # Removed Toilet Count Input, Keep Sleepiness and Memo
+            st.session_state.sleepiness = st.slider("起床時の眠気 (1-10)", 1, 10, st.session_state.sleepiness)
         
-        # Memo input - use key to bind directly if possible, or manual update
-        new_memo = st.text_area("特記事項(メモ)", value=st.session_state.memo, height=100)
-        st.session_state.memo = new_memo # Update state immediately
+            # Memo input - use key to bind directly if possible, or manual update
+            new_memo = st.text_area("特記事項(メモ)", value=st.session_state.memo, height=100)
+            st.session_state.memo = new_memo # Update state immediately
 
-        # Remove Item Managements
-        if st.session_state.segments or st.session_state.events:
-            with st.expander("追加項目の管理（削除）"):
-                if st.session_state.segments:
-                    st.markdown("**睡眠区間**")
-                    for i, seg in enumerate(st.session_state.segments):
-                        col_del, col_info = st.columns([1, 4])
-                        if col_del.button("削除", key=f"del_seg_{i}"):
-                            st.session_state.segments.pop(i)
-                            st.rerun()
-                        col_info.text(f"{seg['type']} ({seg['start'].strftime('%H:%M')} ~ {seg['end'].strftime('%H:%M')})")
-                
-                if st.session_state.events:
-                    st.markdown("**イベント**")
-                    for i, evt in enumerate(st.session_state.events):
-                        col_del, col_info = st.columns([1, 4])
-                        if col_del.button("削除", key=f"del_evt_{i}"):
-                            st.session_state.events.pop(i)
-                            st.rerun()
-                        col_info.text(f"{evt['type']} at {evt['time'].strftime('%H:%M')}")
-
-        # Save Button
-        if st.button("日次データを保存", type="primary"):
-            # 1. Create or Update SleepLog
-            log = existing_log
-            if not log:
-                log = SleepLog(user_id=1, date=selected_date)
-                db.add(log)
-                db.commit() 
-                db.refresh(log)
-            
             # Auto-calculate toilet count from events
             toilet_c = 0
             for e in st.session_state.events:
                 if "toilet" in e['type']:
                     toilet_c += 1
-            
-            # Update info
-            log.sleepiness = st.session_state.sleepiness
-            log.memo = st.session_state.memo
-            log.toilet_count = toilet_c
-            
-            # 2. Replace Segments/Events
-            for s in log.segments: db.delete(s)
-            for e in log.events: db.delete(e)
-            
-            for s in st.session_state.segments:
-                new_seg = SleepSegment(
-                    log_id=log.id,
-                    segment_type=s['type'],
-                    start_at=s['start'].strftime("%H:%M"),
-                    end_at=s['end'].strftime("%H:%M")
-                )
-                db.add(new_seg)
-                
-            for e in st.session_state.events:
-                new_evt = Event(
-                    log_id=log.id,
-                    event_type=e['type'],
-                    happened_at=e['time'].strftime("%H:%M")
-                )
-                db.add(new_evt)
+
+            # Validate the unsaved edits (sort-and-sweep, cheap on every rerun)
+            issues = validate_day(
+                st.session_state.sleepiness,
+                toilet_c,
+                list(st.session_state.segments),
+                st.session_state.memo
+            )
+            errors = [i for i in issues if i.level == ERROR]
+            error_segments = set(n for i in errors for n in i.segments)
+
+            # Remove Item Managements
+            if st.session_state.segments or st.session_state.events:
+                with st.expander("追加項目の管理（削除）", expanded=bool(error_segments)):
+                    if st.session_state.segments:
+                        st.markdown("**睡眠区間**")
+                        for i, seg in enumerate(st.session_state.segments):
+                            col_del, col_info = st.columns([1, 4])
+                            if col_del.button("削除", key=f"del_seg_{i}"):
+                                st.session_state.segments.remove(i)
+                                st.rerun()
+                            mark = "❌ " if i in error_segments else ""
+                            col_info.text(f"{mark}{seg.segment_type} ({minutes_to_hhmm(seg.start_min)} ~ {minutes_to_hhmm(seg.end_min)})")
                 
-            db.commit()
-            st.success("保存しました！")
-            st.rerun() # Force reload to show updated summary
+                    if st.session_state.events:
+                        st.markdown("**イベント**")
+                        for i, evt in enumerate(st.session_state.events):
+                            col_del, col_info = st.columns([1, 4])
+                            if col_del.button("削除", key=f"del_evt_{i}"):
+                                st.session_state.events.pop(i)
+                                st.rerun()
+                            col_info.text(f"{evt['type']} at {evt['time'].strftime('%H:%M')}")
+
+            # Save Button
+            if st.button("日次データを保存", type="primary"):
+                if errors:
+                    # E1-E3: save blocked
+                    banner.error("保存できません。\n\n" + "\n".join(f"- {message(i)}" for i in errors))
+                else:
+                    # Diff against the stored day (segments/events/summary) in one transaction
+                    repo.save(
+                        selected_date,
+                        {
+                            'sleepiness': st.session_state.sleepiness,
+                            'memo': st.session_state.memo,
+                            'toilet_count': toilet_c
+                        },
+                        [(s.segment_type, minutes_to_hhmm(s.start_min), minutes_to_hhmm(s.end_min)) for s in st.session_state.segments],
+                        [(e['type'], e['time'].strftime("%H:%M")) for e in st.session_state.events]
+                    )
+
+                    repo.commit() # Also invalidates the cached month of this day
+                    st.session_state.entry_notice = True # Shown after the rerun
+                    st.rerun() # Force reload to show updated summary
 
-        st.markdown("---")
+            if st.session_state.pop('entry_notice', False):
+                banner.success("保存しました！")
+                # Saved as ⚠️ (required missing) / saved with warnings
+                missing = [message(i) for i in issues if i.level == MISSING]
+                if missing:
+                    banner.warning("「一部不足」として記録されました。\n\n" + "\n".join(f"- {m}" for m in missing))
+                warnings = [message(i) for i in issues if i.level not in (ERROR, MISSING)]
+                if warnings:
+                    banner.warning("\n".join(f"- {w}" for w in warnings))
 
-        # 4. Registered Data Summary (Text Based) - MOVED TO BOTTOM
-        st.subheader(f"{selected_date.strftime('%Y/%m/%d')} の登録データ概要")
+            st.markdown("---")
+
+            # 4. Registered Data Summary (Text Based) - MOVED TO BOTTOM
+            st.subheader(f"{selected_date.strftime('%Y/%m/%d')} の登録データ概要")
         
-        summ_col1, summ_col2 = st.columns(2)
+            summ_col1, summ_col2 = st.columns(2)
         
-        with summ_col1:
-            st.markdown("##### 🛌 睡眠区間")
-            if st.session_state.segments:
-                seg_map = {
-                    "In-bed": "布団内",
-                    "Deep Sleep": "ぐっすり",
-                    "Doze": "うとうと",
-                    "Awake": "覚醒"
-                }
-                # Format for display
-                seg_display = []
-                for s in st.session_state.segments:
-                    raw_type = s['type'].split("(")[0].strip()
-                    jp_type = seg_map.get(raw_type, raw_type)
+            with summ_col1:
+                st.markdown("##### 🛌 睡眠区間")
+                if st.session_state.segments:
+                    seg_map = {
+                        "In-bed": "布団内",
+                        "Deep Sleep": "ぐっすり",
+                        "Doze": "うとうと",
+                        "Awake": "覚醒"
+                    }
+                    # Format for display
+                    seg_display = []
+                    for s in st.session_state.segments:
+                        raw_type = s.segment_type.split("(")[0].strip()
+                        jp_type = seg_map.get(raw_type, raw_type)
                     
-                    seg_display.append({
-                        "種類": jp_type,
-                        "開始": s['start'].strftime("%H:%M"),
-                        "終了": s['end'].strftime("%H:%M")
-                    })
-                st.table(seg_display)
-            else:
-                st.info("データなし")
+                        seg_display.append({
+                            "種類": jp_type,
+                            "開始": minutes_to_hhmm(s.start_min),
+                            "終了": minutes_to_hhmm(s.end_min)
+                        })
+                    st.table(seg_display)
+                else:
+                    st.info("データなし")
 
-        with summ_col2:
-            st.markdown("##### 📍 イベント")
-            if st.session_state.events:
-                evt_map = {
-                    "sleep_med": "睡眠薬",
-                    "toilet": "トイレ",
-                    "other_med": "その他薬",
-                    "alcohol": "飲酒",
-                    "caffeine": "カフェイン",
-                    "bath": "入浴"
-                }
-                evt_display = []
-                for e in st.session_state.events:
-                    raw_type = e['type'].split("(")[0].strip()
-                    jp_type = evt_map.get(raw_type, raw_type)
+            with summ_col2:
+                st.markdown("##### 📍 イベント")
+                if st.session_state.events:
+                    evt_map = {
+                        "sleep_med": "睡眠薬",
+                        "toilet": "トイレ",
+                        "other_med": "その他薬",
+                        "alcohol": "飲酒",
+                        "caffeine": "カフェイン",
+                        "bath": "入浴"
+                    }
+                    evt_display = []
+                    for e in st.session_state.events:
+                        raw_type = e['type'].split("(")[0].strip()
+                        jp_type = evt_map.get(raw_type, raw_type)
                     
-                    evt_display.append({
-                        "種類": jp_type,
-                        "時刻": e['time'].strftime("%H:%M")
-                    })
-                st.table(evt_display)
-            else:
-                st.info("データなし")
+                        evt_display.append({
+                            "種類": jp_type,
+                            "時刻": e['time'].strftime("%H:%M")
+                        })
+                    st.table(evt_display)
+                else:
+                    st.info("データなし")
         
-        # Metrics Summary
-        st.markdown("##### 📝 日次情報確認")
+            # Metrics Summary
+            st.markdown("##### 📝 日次情報確認")
         
-        # Calculate toilet count for display
-        display_toilet_count = 0
-        if st.session_state.events:
-             for e in st.session_state.events:
-                if "toilet" in e['type']:
-                    display_toilet_count += 1
+            # Calculate toilet count for display
+            display_toilet_count = 0
+            if st.session_state.events:
+                 for e in st.session_state.events:
+                    if "toilet" in e['type']:
+                        display_toilet_count += 1
                     
-        m_col1, m_col2, m_col3, m_col4 = st.columns([1, 1, 1, 3])
+            m_col1, m_col2, m_col3, m_col4 = st.columns([1, 1, 1, 3])
         
-        # Calculate Sleep Duration for Display
-        disp_sleep_mins = 0
-        for s in st.session_state.segments:
-            if "Deep" in s['type'] or "Doze" in s['type']:
-                try:
-                    # s['start'] and s['end'] are time objects
-                    # Need full datetime for calc
-                    d_s = datetime.combine(date.min, s['start'])
-                    d_e = datetime.combine(date.min, s['end'])
-                    if d_e < d_s:
-                        d_e += timedelta(days=1)
-                    disp_sleep_mins += (d_e - d_s).total_seconds() / 60
-                except:
-                   pass
-        
-        disp_hours = int(disp_sleep_mins // 60)
-        disp_mins = int(disp_sleep_mins % 60)
-        disp_sleep_str = f"{disp_hours}h {disp_mins}m"
-
-        m_col1.metric("眠気", st.session_state.sleepiness)
-        m_col2.metric("睡眠時間", disp_sleep_str)
-        m_col3.metric("トイレ回数", display_toilet_count)
-        m_col4.text_area("メモ内容", value=st.session_state.memo, disabled=True, height=68, key="memo_display")
-
-    elif page == "📄 PDF出力":
-        st.title("PDF出力")
-        
-        st.markdown("### 1. キャリブレーション (位置調整用)")
-        st.caption("テストデータを使ってPDFのレイアウトを確認します。")
-        
-        if st.button("キャリブレーションPDFを生成"):
-            gen = SleepPDFGenerator()
-            output_path = "calibration_grid.pdf"
+            # Calculate Sleep Duration for Display (unsaved edits included; Deep + Doze coverage)
+            disp_sleep_mins = st.session_state.segments.coverage(SLEEP_KINDS)
+        
+            disp_hours = disp_sleep_mins // 60
+            disp_mins = disp_sleep_mins % 60
+            disp_sleep_str = f"{disp_hours}h {disp_mins}m"
+
+            m_col1.metric("眠気", st.session_state.sleepiness)
+            m_col2.metric("睡眠時間", disp_sleep_str)
+            m_col3.metric("トイレ回数", display_toilet_count)
+            m_col4.text_area("メモ内容", value=st.session_state.memo, disabled=True, height=68, key="memo_display")
+
+        elif page == "📄 PDF出力":
+            # PDF stack (reportlab, fonts, numpy) is loaded on first visit, not at startup
+            from pdf_generator import SleepPDFGenerator
+            from export import PDF_MAX_DAYS, export_range, bundle_zip, user_header, zip_file_name
+        
+            st.title("PDF出力")
+        
+            st.markdown("### 1. キャリブレーション (位置調整用)")
+            st.caption("テストデータを使ってPDFのレイアウトを確認します。")
+        
+            if st.button("キャリブレーションPDFを生成"):
+                gen = SleepPDFGenerator()
             
-            # Use Dummy Data to verify "blue bar" visibility
-            dummy_data = [{
-                'day_index': 0, # Day 1
-                'start_hour': 6.0,
-                'end_hour': 12.0,
-                'type': 'Calibration'
-            }]
+                # Use Dummy Data to verify "blue bar" visibility
+                dummy_data = [{
+                    'day_index': 0, # Day 1
+                    'start_hour': 6.0,
+                    'end_hour': 12.0,
+                    'type': 'Calibration'
+                }]
             
-            # Dummy Daily Logs + Events + Header for Calibration
-            dummy_daily_logs = {
-                0: {
-                    'sleepiness': 7,
-                    'memo': 'これはテスト用の長いメモです。折り返し確認用テキスト。',
-                    'events': [
-                        {'time': 22.0, 'type': 'sleep_med'}, # ▲ at 22:00
-                        {'time': 2.5, 'type': 'toilet'}      # ▽ at 2:30 (next day side)
-                    ]
+                # Dummy Daily Logs + Events + Header for Calibration
+                dummy_daily_logs = {
+                    0: {
+                        'sleepiness': 7,
+                        'memo': 'これはテスト用の長いメモです。折り返し確認用テキスト。',
+                        'events': [
+                            {'time': 22.0, 'type': 'sleep_med'}, # ▲ at 22:00
+                            {'time': 2.5, 'type': 'toilet'}      # ▽ at 2:30 (next day side)
+                        ]
+                    }
                 }
-            }
-            dummy_user_info = {'name': 'Test User', 'id': '001', 'year': 2026, 'month': 2}
+                dummy_user_info = {'name': 'Test User', 'id': '001', 'year': 2026, 'month': 2}
             
-            # Pass dummy data
-            gen.generate(dummy_data, dummy_daily_logs, dummy_user_info, output_path, debug=True)
+                # Pass dummy data (rendered in memory, nothing written to disk)
+                pdf_bytes = gen.generate(dummy_data, dummy_daily_logs, dummy_user_info, debug=True)
                  
-            with open(output_path, "rb") as f:
                 st.download_button(
                     label="Download Calibration PDF",
-                    data=f,
+                    data=pdf_bytes,
                     file_name="calibration_grid.pdf",
                     mime="application/pdf"
                 )
-            st.success("Calibration PDF generated!")
+                st.success("Calibration PDF generated!")
 
-        st.markdown("---")
-        st.markdown("### 2. Monthly Report")
-        target_month = st.date_input("Target Month", date.today())
+            st.markdown("---")
+            st.markdown("### 2. Monthly Report")
+            target_month = st.date_input("Target Month", date.today())
         
-        if st.button("Generate Monthly Report"):
-             # 1. Fetch Data
-             start_date = target_month.replace(day=1)
-             next_month = start_date.replace(day=28) + timedelta(days=4)
-             end_date = next_month - timedelta(days=next_month.day)
-             
-             logs = db.query(SleepLog).filter(
-                 SleepLog.user_id == 1, 
-                 SleepLog.date >= start_date,
-                 SleepLog.date <= end_date
-             ).all()
+            if st.button("Generate Monthly Report"):
+                 # Whole calendar month containing the selected date
+                 month_start = target_month.replace(day=1)
+                 next_month = month_start.replace(day=28) + timedelta(days=4)
+                 month_end = next_month - timedelta(days=next_month.day)
              
-             pdf_data = []
-             daily_logs = {}
+                 header = user_header(db.get(User, repo.user_id), current_username)
+                 (file_name, pdf_bytes), = export_range(db, repo.user_id, month_start, month_end, header,
+                                                        logs=repo.days(month_start, month_end))
              
-             for log in logs:
-                 day_index = log.date.day - 1 # 0-indexed (1st = 0)
-                 
-                 # Prepare Daily Metrics
-                 d_events = []
-                 for evt in log.events:
-                     try:
-                         et = datetime.strptime(evt.happened_at, "%H:%M").time()
-                         et_float = et.hour + et.minute/60.0
-                         d_events.append({'time': et_float, 'type': evt.event_type})
-                     except ValueError:
-                         continue
-                 
-                 # Calculate Total Sleep Time (Deep + Doze)
-                 total_minutes = 0
-                 for seg in log.segments:
-                     if "Deep" in seg.segment_type or "Doze" in seg.segment_type:
-                         try:
-                             t_s = datetime.strptime(seg.start_at, "%H:%M").time()
-                             t_e = datetime.strptime(seg.end_at, "%H:%M").time()
-                             
-                             dt_s = datetime.combine(date.min, t_s)
-                             dt_e = datetime.combine(date.min, t_e)
-                             
-                             if t_e < t_s:
-                                 dt_e += timedelta(days=1)
-                                 
-                             duration = (dt_e - dt_s).total_seconds() / 60
-                             total_minutes += duration
-                         except ValueError:
-                             continue
-                 
-                 # Format Duration
-                 hours = int(total_minutes // 60)
-                 mins = int(total_minutes % 60)
-                 duration_str = f"睡眠時間: {hours}h{mins:02d}m"
-                 
-                 daily_logs[day_index] = {
-                     'sleepiness': log.sleepiness,
-                     'memo': log.memo, # Keep original memo
-                     'total_sleep': duration_str, # Pass separately
-                     'events': d_events
-                 }
-                 
-                 for seg in log.segments:
-                     
-                     # Parse stored string times back to time objects
-                     try:
-                         t_s = datetime.strptime(seg.start_at, "%H:%M").time()
-                         t_e = datetime.strptime(seg.end_at, "%H:%M").time()
-                     except ValueError:
-                         continue # Skip malformed data
-
-                     def time_to_float(t):
-                         return t.hour + t.minute/60.0
-                     
-                     s_h = time_to_float(t_s)
-                     e_h = time_to_float(t_e)
-                     
-                     # Check for midnight crossing
-                     if e_h < s_h:
-                         # Split into two segments
-                         
-                         # 1. Start Time to 24:00 (Current Day)
-                         pdf_data.append({
-                             'day_index': day_index,
-                             'start_hour': s_h,
-                             'end_hour': 24.0,
-                             'type': seg.segment_type
-                         })
-                         
-                         # 2. 0:00 to End Time (Same Day, Left side)
-                         pdf_data.append({
-                             'day_index': day_index, # Keep same day
-                             'start_hour': 0.0,
-                             'end_hour': e_h,
-                             'type': seg.segment_type
-                         })
-                     else:
-                         # Normal segment (Same day)
-                         pdf_data.append({
-                             'day_index': day_index,
-                             'start_hour': s_h,
-                             'end_hour': e_h,
-                             'type': seg.segment_type
-                         })
-             
-             # 2. Generate
-             gen = SleepPDFGenerator()
-             
-             # Fetch user info for header
-             current_username = st.session_state.get("username")
-             current_user = db.query(User).filter(User.username == current_username).first()
-             u_name = current_user.display_name if current_user and current_user.display_name else (current_username or "User")
-             u_id = current_user.header_user_id if current_user and current_user.header_user_id else ""
-             
-             user_info = {
-                 'name': u_name, 
-                 'id': u_id, 
-                 'year': target_month.year, 
-                 'month': target_month.month
-             }
-             
-             output_path = f"report_{target_month.strftime('%Y_%m')}.pdf"
-             gen.generate(pdf_data, daily_logs, user_info, output_path, debug=False)
-             
-             with open(output_path, "rb") as f:
-                st.download_button(
-                    label="月次レポートをダウンロード",
-                    data=f,
-                    file_name=output_path,
-                    mime="application/pdf"
-                )
-             st.success(f"{target_month.strftime('%Y-%m')} のレポートを作成しました！")
+                 st.download_button(
+                     label="月次レポートをダウンロード",
+                     data=pdf_bytes,
+                     file_name=file_name,
+                     mime="application/pdf"
+                 )
+                 st.success(f"{target_month.strftime('%Y-%m')} のレポートを作成しました！")
 
-    elif page == "⚙️ 設定":
-        st.title("設定")
-        st.subheader("ユーザープロフィール設定")
+            st.markdown("---")
+            st.markdown("### 3. 期間指定出力")
+            st.caption("月をまたぐ期間は月ごとのPDFに分割し、ZIPにまとめて出力します。")
         
-        current_username = st.session_state.get("username")
-        current_user = db.query(User).filter(User.username == current_username).first()
+            r_col1, r_col2 = st.columns(2)
+            range_start = r_col1.date_input("開始日", date.today().replace(day=1), key="range_start")
+            range_end = r_col2.date_input("終了日", date.today(), key="range_end")
         
-        if current_user:
-            with st.form("profile_settings"):
-                new_display_name = st.text_input("表示用氏名 (PDFヘッダー)", value=current_user.display_name if current_user.display_name else "")
-                new_header_id = st.text_input("表示用ID (PDFヘッダー)", value=current_user.header_user_id if current_user.header_user_id else "")
+            if st.button("期間レポートを作成"):
+                if range_end < range_start:
+                    st.error("終了日は開始日以降を指定してください。")
+                elif (range_end - range_start).days + 1 > PDF_MAX_DAYS:
+                    # Rendered synchronously and kept in session_state: same cap as the API
+                    st.error(f"期間は{PDF_MAX_DAYS}日以内で指定してください。")
+                else:
+                    header = user_header(db.get(User, repo.user_id), current_username)
+                    # One fetch_logs query for the whole range (not one cached query per month)
+                    files = export_range(db, repo.user_id, range_start, range_end, header)
+                    # Kept in session so per-month downloads survive the rerun each download triggers
+                    st.session_state.range_export = {
+                        'zip_name': zip_file_name(range_start, range_end),
+                        'files': files
+                    }
+        
+            range_export = st.session_state.get('range_export')
+            if range_export:
+                files = range_export['files']
+                if len(files) > 1:
+                    st.download_button(
+                        label=f"ZIPをダウンロード ({len(files)}ヶ月分)",
+                        data=bundle_zip(files),
+                        file_name=range_export['zip_name'],
+                        mime="application/zip",
+                        key="range_zip"
+                    )
+                    st.caption("月ごとのダウンロード")
+                for file_name, pdf_bytes in files:
+                    st.download_button(
+                        label=file_name,
+                        data=pdf_bytes,
+                        file_name=file_name,
+                        mime="application/pdf",
+                        key=f"range_pdf_{file_name}"
+                    )
+
+        elif page == "⚙️ 設定":
+            st.title("設定")
+            st.subheader("ユーザープロフィール設定")
+        
+            current_user = db.get(User, repo.user_id)
+            if current_user:
+                with st.form("profile_settings"):
+                    new_display_name = st.text_input("表示用氏名 (PDFヘッダー)", value=current_user.display_name if current_user.display_name else "")
+                    new_header_id = st.text_input("表示用ID (PDFヘッダー)", value=current_user.header_user_id if current_user.header_user_id else "")
                 
-                if st.form_submit_button("保存"):
-                    current_user.display_name = new_display_name
-                    current_user.header_user_id = new_header_id
-                    db.commit()
-                    st.success("設定を更新しました！")
-                    st.rerun()
-        else:
-            st.error(f"ユーザー情報が見つかりません。(Username: {current_username})")
+                    if st.form_submit_button("保存"):
+                        current_user.display_name = new_display_name
+                        current_user.header_user_id = new_header_id
+                        db.commit()
+                        st.success("設定を更新しました！")
+                        st.rerun()
+            else:
+                st.error(f"ユーザー情報が見つかりません。(Username: {current_username})")
+
+            st.subheader("データのインポート / エクスポート")
+            io_format = st.radio("形式", ["CSV", "JSON Lines"], horizontal=True)
+            fmt = 'csv' if io_format == "CSV" else 'jsonl'
+
+            # Export (backup / analysis)
+            ex_col1, ex_col2 = st.columns(2)
+            with ex_col1:
+                io_start = st.date_input("開始日", date.today().replace(month=1, day=1), key="io_start")
+            with ex_col2:
+                io_end = st.date_input("終了日", date.today(), key="io_end")
+
+            if st.button("エクスポートファイルを作成"):
+                buffer = io.StringIO()
+                count = export_days(db, repo.user_id, io_start, io_end, buffer, fmt)
+                # BOM so spreadsheet apps open Japanese CSV correctly (import accepts it)
+                data = buffer.getvalue().encode('utf-8-sig' if fmt == 'csv' else 'utf-8')
+                st.session_state.io_export = (f"sleep_log_{io_start:%Y%m%d}-{io_end:%Y%m%d}.{fmt}", data, count)
+
+            if 'io_export' in st.session_state:
+                file_name, data, count = st.session_state.io_export
+                st.download_button(f"📥 {file_name} ({count}日分)", data, file_name=file_name)
+
+            # Import (paper ledgers / other trackers)
+            uploaded = st.file_uploader("インポートするファイル", type=["csv", "jsonl", "json", "ndjson"])
+            overwrite = st.checkbox("登録済みの日を上書きする")
+            if uploaded is not None and st.button("インポート"):
+                text = io.TextIOWrapper(uploaded, encoding='utf-8-sig', newline='')
+                result = import_days(repo.user_id, text, format_for(uploaded.name), 'replace' if overwrite else 'skip')
+                repo.invalidate_cache() # Imported days bypass repo.save
+                st.success(f"{result['inserted']}日分を登録しました (登録済みのためスキップ: {result['skipped']}日)")
+                if result['errors']:
+                    st.warning(f"{len(result['errors'])}件のエラーがあったため、該当する日は登録されていません。")
+                    st.text("\n".join(f"{line_no}行目: {message}" for line_no, message in result['errors'][:100]))
+
+            st.subheader("キャッシュ統計")
+            stats = month_cache.stats()
+            c_col1, c_col2, c_col3, c_col4 = st.columns(4)
+            c_col1.metric("ヒット率", f"{stats['hit_rate']:.0%}")
+            c_col2.metric("ヒット / ミス", f"{stats['hits']} / {stats['misses']}")
+            c_col3.metric("キャッシュ中の月数", f"{stats['months']} / {month_cache.max_months}")
+            c_col4.metric("破棄 (LRU / 保存)", f"{stats['evictions']} / {stats['invalidations']}")
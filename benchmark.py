@@ -0,0 +1,328 @@
+"""Timing checks for performance-sensitive paths.
+
+Usage:
+    python benchmark.py pdf [runs]
+    python benchmark.py hatch [runs]
+    python benchmark.py startup [runs]
+    python benchmark.py api [requests]
+    python benchmark.py validate [days]
+    python benchmark.py analytics [years]
+"""
+import base64
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import date, timedelta
+
+# Segment types as stored by the daily-entry page / populate_data.py
+TYPE_IN_BED = "In-bed (布団に入っている)"
+TYPE_DEEP = "Deep Sleep (ぐっすり)"
+TYPE_DOZE = "Doze (うとうと)"
+TYPE_AWAKE = "Awake (眠れない)"
+
+
+def sample_month(days=31):
+    """A month of PDF input shaped like populate_data.py output (no DB needed)"""
+    segments = []
+    daily_logs = {}
+    for day_index in range(days):
+        bed = 22.0 + (day_index % 4) * 0.25
+        wake = 6.0 + (day_index % 3) * 0.5
+        # Midnight-crossing segments are split the same way app.py does
+        for s_type, start, end in [
+            (TYPE_IN_BED, bed, wake),
+            (TYPE_DEEP, bed + 0.25, 0.5),
+            (TYPE_DOZE, 0.5, 1.5),
+            (TYPE_AWAKE, 1.5, 2.0),
+            (TYPE_DEEP, 2.0, wake - 0.25),
+        ]:
+            if end < start:
+                segments.append({'day_index': day_index, 'start_hour': start, 'end_hour': 24.0, 'type': s_type})
+                segments.append({'day_index': day_index, 'start_hour': 0.0, 'end_hour': end, 'type': s_type})
+            else:
+                segments.append({'day_index': day_index, 'start_hour': start, 'end_hour': end, 'type': s_type})
+        if day_index % 3 == 0:
+            # Afternoon nap
+            segments.append({'day_index': day_index, 'start_hour': 14.0, 'end_hour': 15.5, 'type': TYPE_DOZE})
+        daily_logs[day_index] = {
+            'sleepiness': day_index % 10 + 1,
+            'memo': "少し途中覚醒があった。" if day_index % 2 else "",
+            'total_sleep': "睡眠時間: 7h30m",
+            'events': [
+                {'time': bed - 0.5, 'type': "sleep_med (睡眠薬)"},
+                {'time': 3.0, 'type': "toilet (トイレ)"},
+            ],
+        }
+    user_info = {'name': "テスト 太郎", 'id': "ID-001", 'year': 2026, 'month': 1}
+    return segments, daily_logs, user_info
+
+
+def _timed(fn, runs):
+    best = None
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_pdf(runs=5):
+    """Per-PDF time with the template re-encoded every time vs. served from the process cache"""
+    from pdf_generator import SleepPDFGenerator, _load_template_xobject
+
+    segments, daily_logs, user_info = sample_month()
+    gen = SleepPDFGenerator()
+
+    def render():
+        gen.generate(segments, daily_logs, user_info)
+
+    def render_uncached():
+        _load_template_xobject.cache_clear()
+        render()
+
+    cold = _timed(render_uncached, runs)
+    warm = _timed(render, runs)
+    print(f"pdf: template decoded per report  {cold * 1000:8.1f} ms")
+    print(f"pdf: template from process cache  {warm * 1000:8.1f} ms  ({cold / warm:.1f}x)")
+
+
+def count_operators(pdf_bytes):
+    """Content-stream operators in a PDF (pages + forms; image data skipped)"""
+    count = 0
+    for header, data in re.findall(rb"<<((?:(?!<<).)*?)>>\s*stream\r?\n(.*?)endstream", pdf_bytes, re.S):
+        if b"/Image" in header:
+            continue
+        if b"/ASCII85Decode" in header:
+            data = base64.a85decode(data.strip().removesuffix(b"~>"))
+        if b"/FlateDecode" in header:
+            data = zlib.decompress(data)
+        # Operators are the bare alphabetic tokens (operands are numbers / names / strings)
+        data = re.sub(rb"\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f]*>", b"", data)
+        count += len(re.findall(rb"(?<![/\w.])[A-Za-z'\"*]+(?![\w.])", data))
+    return count
+
+
+def bench_hatch(runs=5):
+    """Doze hatching: one c.line per 3pt (previous behaviour) vs. the shared hatch form"""
+    from pdf_generator import SleepPDFGenerator, HATCH_STEP
+
+    class LineHatchGenerator(SleepPDFGenerator):
+        def _draw_doze(self, c, x, y, w, h):
+            c.rect(x, y, w, h, stroke=1, fill=0)
+            c.saveState()
+            p = c.beginPath()
+            p.rect(x, y, w, h)
+            c.clipPath(p, stroke=0, fill=0)
+            for lx in range(int(x - h), int(x + w), HATCH_STEP):
+                c.line(lx, y, lx + h, y + h)
+            c.restoreState()
+
+    segments, daily_logs, user_info = sample_month()
+    for label, gen in [("per-line", LineHatchGenerator()), ("hatch form", SleepPDFGenerator())]:
+        pdf_bytes = gen.generate(segments, daily_logs, user_info)
+        elapsed = _timed(lambda: gen.generate(segments, daily_logs, user_info), runs)
+        print(f"hatch: {label:<10}  {count_operators(pdf_bytes):6d} ops  "
+              f"{len(pdf_bytes) / 1024:7.1f} KiB  {elapsed * 1000:7.1f} ms")
+
+
+# What app.py imports on every script run, and what must stay out of it
+STARTUP_MODULES = ["models", "repository", "summary", "data_io", "validation", "intervals"]
+DEFERRED_MODULES = ["reportlab", "pdf_generator", "export"]
+# What the PDF stack (and every PDF pool worker) must not load
+APP_MODULES = ["models", "streamlit", "sqlalchemy"]
+
+
+def import_times(statement):
+    """Run `statement` under python -X importtime: ({module: cumulative us}, stdout)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m and not m.group(2):
+            times[m.group(3)] = int(m.group(1))
+    return times, proc.stdout.strip()
+
+
+def bench_startup(runs=3):
+    """Import cost of the app's startup modules; fails if the PDF stack is pulled in"""
+    check = (
+        "import sys; import " + ", ".join(STARTUP_MODULES) + "; "
+        "print(','.join(m for m in " + repr(DEFERRED_MODULES) + " if m in sys.modules))"
+    )
+    best = None
+    for _ in range(runs):
+        times, leaked = import_times(check)
+        if best is None or sum(times.values()) < sum(best.values()):
+            best = times
+    print("startup: top-level imports (cumulative)")
+    for name, us in sorted(best.items(), key=lambda kv: -kv[1])[:10]:
+        print(f"  {name:<28} {us / 1000:8.1f} ms")
+    print(f"  {'total':<28} {sum(best.values()) / 1000:8.1f} ms")
+
+    deferred, pdf_leaked = import_times(
+        "import sys, pdf_generator; "
+        "print(','.join(m for m in " + repr(APP_MODULES) + " if m in sys.modules))"
+    )
+    print(f"startup: deferred PDF stack (pdf_generator) {deferred.get('pdf_generator', 0) / 1000:8.1f} ms")
+
+    if leaked:
+        print(f"startup: REGRESSION - loaded at startup: {leaked}")
+    if pdf_leaked:
+        print(f"startup: REGRESSION - loaded by pdf_generator: {pdf_leaked}")
+    if leaked or pdf_leaked:
+        sys.exit(1)
+
+
+def bench_api(requests=200):
+    """Per-endpoint latency of api.py through the in-process client (temporary SQLite DB, 1 user x 1 year)"""
+    tmp = tempfile.mkdtemp(prefix="sleep_api_bench_")
+    # Must be set before models / api are imported
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+    os.environ['AUTH_CONFIG'] = os.path.join(tmp, "auth_config.yaml")
+
+    import bcrypt
+    import random
+    import yaml
+    from fastapi.testclient import TestClient
+    import api
+    from models import engine, init_db, SessionLocal
+    from populate_data import generate_day
+    from repository import bulk_insert_days, ensure_user
+
+    password_hash = bcrypt.hashpw(b"bench", bcrypt.gensalt()).decode()
+    with open(os.environ['AUTH_CONFIG'], "w") as f:
+        yaml.safe_dump({'credentials': {'usernames': {'bench': {'email': "bench@example.com", 'name': "Bench", 'password': password_hash}}}}, f)
+
+    init_db()
+    with SessionLocal() as db:
+        user, _ = ensure_user(db, "bench", {'name': "Bench"})
+        user_id = user.id
+    random.seed(0)
+    start = date(2025, 1, 1)
+    with engine.begin() as conn:
+        bulk_insert_days(conn, user_id, (generate_day(start + timedelta(days=i)) for i in range(365)))
+
+    auth = ("bench", "bench")
+    day = {'date': "2026-01-01", 'sleepiness': 5, 'segments': [
+        {'type': TYPE_IN_BED, 'start': "23:00", 'end': "07:00"},
+        {'type': TYPE_DEEP, 'start': "23:30", 'end': "06:30"},
+    ], 'events': [{'type': "toilet (トイレ)", 'time': "03:00"}]}
+
+    with TestClient(api.app) as client:
+        t0 = time.perf_counter()
+        client.get("/logs/month", params={'year': 2025, 'month': 6}, auth=auth)
+        print(f"api: first request (bcrypt check)   {(time.perf_counter() - t0) * 1000:8.1f} ms")
+        log_id = client.post("/logs/day", json=day, auth=auth).json()['id']
+
+        cases = [
+            ("GET  /logs/month", lambda: client.get("/logs/month", params={'year': 2025, 'month': 6}, auth=auth)),
+            ("GET  /logs/day", lambda: client.get("/logs/day", params={'date': "2025-06-15"}, auth=auth)),
+            ("POST /logs/summary (1 year)", lambda: client.post("/logs/summary", json={'start_date': "2025-01-01", 'end_date': "2025-12-31"}, auth=auth)),
+            ("PUT  /logs/day (unchanged)", lambda: client.put(f"/logs/day/{log_id}", json=day, auth=auth)),
+            ("POST /pdf/generate (month)", lambda: client.post("/pdf/generate", json={'mode': "month", 'year': 2025, 'month': 6}, auth=auth)),
+        ]
+        for label, call in cases:
+            n = requests if "pdf" not in label else max(requests // 20, 3)
+            t0 = time.perf_counter()
+            for _ in range(n):
+                response = call()
+                assert response.status_code == 200, (label, response.status_code, response.text[:200])
+            elapsed = time.perf_counter() - t0
+            print(f"api: {label:<28} {elapsed / n * 1000:7.2f} ms/req  {n / elapsed:8.1f} req/s")
+
+
+def bench_validate(days=3650):
+    """Save-time validation of generated days: validate_day per day vs. validate_days over the batch"""
+    import random
+    from models import hhmm_to_minutes
+    from populate_data import generate_day
+    from validation import validate_day, validate_days
+
+    random.seed(0)
+    start = date(2026, 1, 1)
+    batch = []
+    for i in range(days):
+        values, segments, _ = generate_day(start + timedelta(days=i))
+        batch.append((values['sleepiness'], values['toilet_count'],
+                      [(s_type, hhmm_to_minutes(s), hhmm_to_minutes(e)) for s_type, s, e in segments],
+                      values['memo']))
+
+    per_day = _timed(lambda: [validate_day(*day) for day in batch], 3)
+    vectorized = _timed(lambda: validate_days(batch), 3)
+    assert validate_days(batch) == [validate_day(*day) for day in batch]
+    print(f"validate: {days} days, validate_day loop  {per_day * 1000:8.1f} ms")
+    print(f"validate: {days} days, validate_days      {vectorized * 1000:8.1f} ms  ({per_day / vectorized:.1f}x)")
+
+
+def bench_analytics(years=5, runs=3):
+    """analytics.sleep_metrics over years of one user's data (temporary SQLite DB)"""
+    tmp = tempfile.mkdtemp(prefix="sleep_analytics_bench_")
+    # Must be set before models is imported
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    import random
+    from models import engine, init_db, SessionLocal
+    from populate_data import generate_day
+    from repository import bulk_insert_days, ensure_user
+    from analytics import load_segments, occupancy_matrix, daily_metrics, metrics_frame
+
+    init_db()
+    with SessionLocal() as db:
+        user, _ = ensure_user(db, "bench", {'name': "Bench"})
+        user_id = user.id
+    random.seed(0)
+    start = date(2020, 1, 1)
+    end = start + timedelta(days=365 * years - 1)
+    with engine.begin() as conn:
+        bulk_insert_days(conn, user_id, (generate_day(start + timedelta(days=i)) for i in range(365 * years)))
+
+    with SessionLocal() as db:
+        stages = {}
+        state = {}
+
+        def run():
+            t0 = time.perf_counter()
+            state['segments'] = load_segments(db, user_id, start, end)
+            t1 = time.perf_counter()
+            state['occupancy'] = occupancy_matrix(state['segments'])
+            t2 = time.perf_counter()
+            metrics = daily_metrics(state['occupancy'], state['segments'].logged)
+            t3 = time.perf_counter()
+            metrics_frame(start, metrics)
+            t4 = time.perf_counter()
+            for name, elapsed in [("load (1 query)", t1 - t0), ("occupancy matrix", t2 - t1),
+                                  ("daily metrics", t3 - t2), ("rolling 7/30d", t4 - t3)]:
+                stages[name] = min(stages.get(name, elapsed), elapsed)
+
+        total = _timed(run, runs)
+    print(f"analytics: {years} years ({365 * years} days, {len(state['segments'].day)} segments, "
+          f"occupancy {state['occupancy'].shape[0]}x{state['occupancy'].shape[1]})")
+    for name, elapsed in stages.items():
+        print(f"  {name:<18} {elapsed * 1000:8.1f} ms")
+    print(f"  {'total':<18} {total * 1000:8.1f} ms")
+
+
+BENCHMARKS = {
+    'pdf': bench_pdf,
+    'hatch': bench_hatch,
+    'startup': bench_startup,
+    'api': bench_api,
+    'validate': bench_validate,
+    'analytics': bench_analytics,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*[int(a) for a in sys.argv[2:]])
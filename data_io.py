@@ -0,0 +1,382 @@
+"""Bulk import / export of sleep logs as CSV or JSON Lines.
+
+Both formats stream: export walks the date range in windows and import
+validates and writes a chunk of days at a time, so memory stays bounded
+for multi-year files.
+
+JSON Lines: one day per line
+    {"date": "2026-02-01", "sleepiness": 5, "toilet_count": 1, "memo": "",
+     "segments": [{"type": "Deep Sleep (ぐっすり)", "start": "23:00", "end": "06:00"}],
+     "events": [{"type": "toilet (トイレ)", "time": "03:00"}]}
+
+CSV: long format, one row per record, rows of a day next to each other
+    record,date,sleepiness,toilet_count,memo,type,start,end,time
+    day,2026-02-01,5,1,,,,,
+    segment,2026-02-01,,,,Deep Sleep (ぐっすり),23:00,06:00,
+    event,2026-02-01,,,,toilet (トイレ),,,03:00
+
+Usage:
+    python data_io.py export FILE --user USERNAME --start YYYY-MM-DD --end YYYY-MM-DD
+    python data_io.py import FILE --user USERNAME [--on-conflict skip|replace] [--dry-run]
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+from datetime import date, timedelta
+from sqlalchemy import select
+from models import engine, init_db, SessionLocal, SleepLog, User, hhmm_to_minutes, minutes_to_hhmm
+from repository import fetch_logs, bulk_insert_days, delete_dates
+from validation import ERROR, validate_days, message
+
+# Days validated and written per transaction on import
+IMPORT_CHUNK_DAYS = 500
+# Days loaded per query window on export
+EXPORT_WINDOW_DAYS = 92
+
+CSV_FIELDS = ['record', 'date', 'sleepiness', 'toilet_count', 'memo', 'type', 'start', 'end', 'time']
+FORMATS = ('csv', 'jsonl')
+
+DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Keywords summary.py classifies segments by
+SEGMENT_KEYWORDS = ("In-bed", "Deep", "Doze", "Awake")
+
+
+def format_for(file_name):
+    """'csv' / 'jsonl' from a file name (.json/.ndjson read as JSON Lines)"""
+    return 'csv' if file_name.lower().endswith('.csv') else 'jsonl'
+
+
+# --- Export ---
+
+def _windows(start_date, end_date, days=EXPORT_WINDOW_DAYS):
+    cur = start_date
+    while cur <= end_date:
+        window_end = min(cur + timedelta(days=days - 1), end_date)
+        yield cur, window_end
+        cur = window_end + timedelta(days=1)
+
+
+def day_dict(log):
+    """JSON Lines day dict of a SleepLog with children loaded"""
+    return {
+        'date': log.date.isoformat(),
+        'sleepiness': log.sleepiness,
+        'toilet_count': log.toilet_count,
+        'memo': log.memo or "",
+        'segments': [
+            {'type': s.segment_type, 'start': s.start_at, 'end': s.end_at}
+            for s in sorted(log.segments, key=lambda s: s.id) # Entry order
+        ],
+        'events': [
+            {'type': e.event_type, 'time': e.happened_at}
+            for e in sorted(log.events, key=lambda e: e.id)
+        ],
+    }
+
+
+def iter_days(db, user_id, start_date, end_date):
+    """Day dicts (JSON Lines shape) of [start_date, end_date] in date order"""
+    for w_start, w_end in _windows(start_date, end_date):
+        for log in fetch_logs(db, user_id, w_start, w_end):
+            yield day_dict(log)
+        # Window rows are no longer needed
+        db.expunge_all()
+
+
+def write_jsonl(days, fp):
+    count = 0
+    for day in days:
+        fp.write(json.dumps(day, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(days, fp):
+    writer = csv.DictWriter(fp, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    count = 0
+    for day in days:
+        writer.writerow({
+            'record': 'day', 'date': day['date'],
+            'sleepiness': day['sleepiness'], 'toilet_count': day['toilet_count'], 'memo': day['memo']
+        })
+        for seg in day['segments']:
+            writer.writerow({'record': 'segment', 'date': day['date'],
+                             'type': seg['type'], 'start': seg['start'], 'end': seg['end']})
+        for evt in day['events']:
+            writer.writerow({'record': 'event', 'date': day['date'],
+                             'type': evt['type'], 'time': evt['time']})
+        count += 1
+    return count
+
+
+def export_days(db, user_id, start_date, end_date, fp, fmt='csv'):
+    """Write a user's days of [start_date, end_date] to a text file object; returns the day count"""
+    writer = write_csv if fmt == 'csv' else write_jsonl
+    return writer(iter_days(db, user_id, start_date, end_date), fp)
+
+
+# --- Import ---
+
+def read_jsonl(fp):
+    """(line_no, raw day dict) per non-empty line"""
+    for line_no, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, {'_error': f"invalid JSON ({e.msg})"}
+            continue
+        yield line_no, raw if isinstance(raw, dict) else {'_error': "expected a JSON object"}
+
+
+def read_csv(fp):
+    """(line_no of the day's first row, raw day dict), grouping consecutive rows by date"""
+    reader = csv.DictReader(fp)
+    current = None
+    for row in reader:
+        line_no = reader.line_num
+        day_str = (row.get('date') or "").strip()
+        if current is None or current['date'] != day_str:
+            if current is not None:
+                yield current['_line'], current
+            current = {'_line': line_no, 'date': day_str, 'segments': [], 'events': []}
+
+        record = (row.get('record') or "").strip()
+        if record == 'day':
+            current['sleepiness'] = row.get('sleepiness')
+            current['toilet_count'] = row.get('toilet_count')
+            current['memo'] = row.get('memo')
+        elif record == 'segment':
+            current['segments'].append({'type': row.get('type'), 'start': row.get('start'), 'end': row.get('end')})
+        elif record == 'event':
+            current['events'].append({'type': row.get('type'), 'time': row.get('time')})
+        else:
+            current.setdefault('_errors', []).append(f"unknown record {record!r} on line {line_no}")
+    if current is not None:
+        yield current['_line'], current
+
+
+def _optional_int(value, name, low, high, errors):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    # JSON true/false and 5.7 are not integers (int() would turn them into 1 and 5)
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        errors.append(f"{name} is not an integer: {value!r}")
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        errors.append(f"{name} is not an integer: {value!r}")
+        return None
+    if not low <= number <= high:
+        errors.append(f"{name} out of range ({low}-{high}): {number}")
+    return number
+
+
+def _hhmm(value, name, errors):
+    value = (value or "").strip() if isinstance(value, str) else value
+    minutes = hhmm_to_minutes(value)
+    if minutes is None:
+        errors.append(f"{name} is not HH:MM: {value!r}")
+        return None
+    # Normalize e.g. '7:05' to '07:05' like the entry form stores it
+    return minutes_to_hhmm(minutes)
+
+
+def _text(value, name, errors):
+    """Stripped string field ("" when missing); None and an error if it is not a string"""
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        errors.append(f"{name} is not a string: {value!r}")
+        return None
+    return value.strip()
+
+
+def _records(value, name, errors):
+    """The objects of a segments/events list; other items (and a non-list value) are errors"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        errors.append(f"{name} is not a list: {value!r}")
+        return []
+    records = []
+    for index, item in enumerate(value, 1):
+        if isinstance(item, dict):
+            records.append(item)
+        else:
+            errors.append(f"{name} item {index} is not an object: {item!r}")
+    return records
+
+
+def parse_day(raw):
+    """Validate a raw day dict: ((values, segments, events), []) or (None, [messages])"""
+    errors = list(raw.get('_errors', []))
+    if '_error' in raw:
+        return None, [raw['_error']]
+
+    raw_date = raw.get('date')
+    try:
+        if not isinstance(raw_date, str) or not DATE_PATTERN.fullmatch(raw_date.strip()):
+            raise ValueError # e.g. 20260107, or the week/compact forms fromisoformat accepts
+        day = date.fromisoformat(raw_date.strip())
+    except ValueError:
+        return None, errors + [f"date is not YYYY-MM-DD: {raw_date!r}"]
+
+    segments = []
+    for seg in _records(raw.get('segments'), "segments", errors):
+        s_type = _text(seg.get('type'), "segment type", errors)
+        if s_type is not None and not any(k in s_type for k in SEGMENT_KEYWORDS):
+            errors.append(f"unknown segment type: {s_type!r}")
+        start_at = _hhmm(seg.get('start'), "segment start", errors)
+        end_at = _hhmm(seg.get('end'), "segment end", errors)
+        segments.append((s_type, start_at, end_at))
+
+    events = []
+    for evt in _records(raw.get('events'), "events", errors):
+        e_type = _text(evt.get('type'), "event type", errors)
+        if e_type == "":
+            errors.append("event type is empty")
+        events.append((e_type, _hhmm(evt.get('time'), "event time", errors)))
+
+    sleepiness = _optional_int(raw.get('sleepiness'), "sleepiness", 1, 10, errors)
+    toilet_count = _optional_int(raw.get('toilet_count'), "toilet_count", 0, 99, errors)
+    if toilet_count is None:
+        # Same rule as the daily-entry form
+        toilet_count = sum(1 for e_type, _ in events if e_type and "toilet" in e_type)
+
+    memo = raw.get('memo') or ""
+    if not isinstance(memo, str):
+        errors.append(f"memo is not a string: {memo!r}")
+
+    if errors:
+        return None, errors
+    values = {'date': day, 'sleepiness': sleepiness, 'toilet_count': toilet_count, 'memo': memo}
+    return (values, segments, events), []
+
+
+def _check_chunk(chunk, errors):
+    """Days of a chunk [(line_no, day)] without save-time errors (E1-E3); the rest go to errors"""
+    checked = validate_days(
+        (values['sleepiness'], values['toilet_count'],
+         [(s_type, hhmm_to_minutes(start_at), hhmm_to_minutes(end_at)) for s_type, start_at, end_at in segments],
+         values['memo'])
+        for _, (values, segments, _) in chunk
+    )
+    valid = []
+    for (line_no, day), issues in zip(chunk, checked):
+        day_errors = [issue for issue in issues if issue.level == ERROR]
+        for issue in day_errors:
+            numbers = ", ".join(str(i + 1) for i in issue.segments)
+            label = "segments" if len(issue.segments) > 1 else "segment"
+            errors.append((line_no, f"{issue.key} ({label} {numbers}): {message(issue)}"))
+        if not day_errors:
+            valid.append(day)
+    return valid
+
+
+def _write_chunk(user_id, chunk, on_conflict):
+    """Insert one chunk of parsed days in its own transaction; returns (inserted, skipped)"""
+    logs = SleepLog.__table__
+    with engine.begin() as conn:
+        dates = [values['date'] for values, _, _ in chunk]
+        existing = set(conn.execute(
+            select(logs.c.date).where(logs.c.user_id == user_id, logs.c.date.in_(dates))
+        ).scalars())
+        if on_conflict == 'replace':
+            delete_dates(conn, user_id, existing)
+            rows = chunk
+        else:
+            rows = [day for day in chunk if day[0]['date'] not in existing]
+        bulk_insert_days(conn, user_id, rows)
+    return len(rows), len(chunk) - len(rows)
+
+
+def import_days(user_id, fp, fmt='csv', on_conflict='skip', dry_run=False, chunk_days=IMPORT_CHUNK_DAYS):
+    """Validate and import days from a text file object.
+
+    Days are validated a chunk at a time (parse, then the save-time rules of
+    validation.py over the whole chunk) and each valid chunk is written in
+    its own transaction, so a failure partway keeps the chunks before it.
+    Invalid days are skipped and reported; days already stored are skipped
+    or, with on_conflict='replace', overwritten.
+
+    Returns {'inserted', 'skipped', 'errors': [(line_no, message)]}.
+    """
+    result = {'inserted': 0, 'skipped': 0, 'errors': []}
+    reader = read_csv if fmt == 'csv' else read_jsonl
+    seen = set()
+    chunk = []
+
+    def flush():
+        days = _check_chunk(chunk, result['errors']) if chunk else []
+        if days and not dry_run:
+            inserted, skipped = _write_chunk(user_id, days, on_conflict)
+            result['inserted'] += inserted
+            result['skipped'] += skipped
+        else:
+            result['inserted'] += len(days)
+        chunk.clear()
+
+    for line_no, raw in reader(fp):
+        key = str(raw.get('date', "")).strip()
+        if key and key in seen:
+            result['errors'].append((line_no, f"duplicate date {key} (rows of a day must be contiguous)"))
+            continue
+        seen.add(key)
+        day, errors = parse_day(raw)
+        if day is None:
+            result['errors'].extend((line_no, error) for error in errors)
+            continue
+        chunk.append((line_no, day))
+        if len(chunk) >= chunk_days:
+            flush()
+    flush()
+    result['errors'].sort(key=lambda error: error[0]) # Save-time errors are found per chunk
+    return result
+
+
+def _user_id(db, username):
+    user = db.query(User).filter(User.username == username).first()
+    if not user:
+        raise SystemExit(f"User not found: {username}")
+    return user.id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import / export sleep logs as CSV or JSON Lines")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file", help="path, or - for stdin/stdout")
+    parser.add_argument("--user", default="user1", help="username (default user1)")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--start", type=date.fromisoformat, default=date(2000, 1, 1))
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today())
+    parser.add_argument("--on-conflict", choices=["skip", "replace"], default="skip")
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    args = parser.parse_args()
+
+    fmt = args.format or format_for(args.file)
+    init_db()
+    with SessionLocal() as db:
+        user_id = _user_id(db, args.user)
+        if args.command == "export":
+            fp = sys.stdout if args.file == "-" else open(args.file, "w", encoding="utf-8", newline="")
+            with fp:
+                count = export_days(db, user_id, args.start, args.end, fp, fmt)
+            print(f"Exported {count} days", file=sys.stderr)
+            sys.exit(0)
+
+    fp = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8-sig", newline="")
+    with fp:
+        result = import_days(user_id, fp, fmt, args.on_conflict, args.dry_run)
+    for line_no, error in result['errors']:
+        print(f"line {line_no}: {error}", file=sys.stderr)
+    verb = "Valid" if args.dry_run else "Imported"
+    print(f"{verb}: {result['inserted']} days, skipped (already stored): {result['skipped']}, "
+          f"invalid: {len(result['errors'])} errors", file=sys.stderr)
+    sys.exit(1 if result['errors'] else 0)
@@ -0,0 +1,218 @@
+"""Monthly / range PDF export (spec_pdf_generation.md).
+
+A range is fetched once, split per calendar month and rendered as one PDF
+per month; cross-month ranges are bundled into an in-memory ZIP.
+Multi-month renders are spread over a process pool (PDF_WORKERS).
+"""
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from repository import fetch_logs
+from month_cache import month_bounds
+from summary import summarize_log
+from intervals import DayIntervals
+from pdf_generator import render_payload
+
+# Worker processes for multi-month/multi-user renders (1 = render in-process)
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', os.cpu_count() or 1))
+# Longest period one range export renders (app.py and the API)
+PDF_MAX_DAYS = int(os.getenv('PDF_MAX_DAYS', 366))
+
+# Workers start from a clean server process, not a fork of the threaded
+# Streamlit/uvicorn process (held locks, the SQLAlchemy pool); spawn where
+# forkserver is unavailable (Windows)
+_MP_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def month_ranges(start_date, end_date):
+    """Split [start_date, end_date] into month-contained (start, end) pairs"""
+    ranges = []
+    cur = start_date
+    while cur <= end_date:
+        month_end = month_bounds(cur.year, cur.month)[1]
+        ranges.append((cur, min(month_end, end_date)))
+        if month_end >= end_date:
+            break # The next month may not exist (December 9999)
+        cur = month_end + timedelta(days=1)
+    return ranges
+
+
+def pdf_file_name(start_date, end_date):
+    return f"sleep_log_{start_date:%Y-%m}_{start_date:%Y%m%d}-{end_date:%Y%m%d}.pdf"
+
+
+def zip_file_name(start_date, end_date):
+    return f"sleep_log_{start_date:%Y%m%d}-{end_date:%Y%m%d}.zip"
+
+
+def user_header(user, fallback_name=None):
+    """Header fields (name/id) for the PDF from a User row"""
+    return {
+        'name': user.display_name if user and user.display_name else (fallback_name or "User"),
+        'id': user.header_user_id if user and user.header_user_id else ""
+    }
+
+
+def build_month_payload(logs):
+    """(segments, daily_logs) arguments of SleepPDFGenerator.generate for one month of logs"""
+    pdf_data = []
+    daily_logs = {}
+
+    for log in logs:
+        day_index = log.date.day - 1 # 0-indexed (1st = 0)
+
+        # Prepare Daily Metrics
+        d_events = []
+        for evt in log.events:
+            if evt.happened_min is None: continue # Skip malformed data
+            d_events.append({'time': evt.happened_min / 60.0, 'type': evt.event_type})
+
+        # Total Sleep Time (Deep + Doze) from the per-day summary
+        summary = log.summary or summarize_log(log)
+        total_minutes = summary.total_sleep_min
+
+        # Format Duration
+        hours = total_minutes // 60
+        mins = total_minutes % 60
+        duration_str = f"睡眠時間: {hours}h{mins:02d}m"
+
+        daily_logs[day_index] = {
+            'sleepiness': log.sleepiness,
+            'memo': log.memo, # Keep original memo
+            'total_sleep': duration_str, # Pass separately
+            'events': d_events
+        }
+
+        # Midnight-crossing segments become two pieces on the same day row
+        # (start..24:00, 0:00..end); malformed times are skipped
+        intervals = DayIntervals.from_segments(
+            [(seg.segment_type, seg.start_min, seg.end_min) for seg in log.segments], strict=False
+        )
+        for piece in intervals.pieces():
+            pdf_data.append({
+                'day_index': day_index,
+                'start_hour': piece.start_min / 60.0,
+                'end_hour': piece.end_min / 60.0,
+                'type': piece.segment_type
+            })
+
+    return pdf_data, daily_logs
+
+
+def range_payloads(db, user_id, start_date, end_date, header, logs=None):
+    """[(file_name, payload)] per month of [start_date, end_date], in month order.
+
+    A payload is the picklable (segments, daily_logs, user_info) argument
+    tuple of SleepPDFGenerator.generate. `logs` (SleepLogs or month-cache
+    DaySnapshots of the range) skips the fetch.
+    """
+    if logs is None:
+        # One fetch for the whole range
+        logs = fetch_logs(db, user_id, start_date, end_date)
+    # Partition rows by month
+    by_month = {}
+    for log in logs:
+        by_month.setdefault((log.date.year, log.date.month), []).append(log)
+
+    payloads = []
+    for m_start, m_end in month_ranges(start_date, end_date):
+        segments, daily_logs = build_month_payload(by_month.get((m_start.year, m_start.month), []))
+        user_info = dict(header, year=m_start.year, month=m_start.month)
+        payloads.append((pdf_file_name(m_start, m_end), (segments, daily_logs, user_info)))
+    return payloads
+
+
+def _executor():
+    """PDF_WORKERS-process pool, created once and shared by every export and thread.
+
+    It is never shut down or resized, so workers keep their template cache warm.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                        mp_context=multiprocessing.get_context(_MP_START_METHOD))
+        return _pool
+
+
+def iter_render_payloads(named_payloads, workers=None, debug=False, invariant=False):
+    """Yield (file_name, pdf_bytes) for [(file_name, payload)] in input order, each as soon as it is ready.
+
+    More than one PDF is rendered on the shared PDF_WORKERS pool (one job
+    per PDF); workers=1 or a single PDF renders in-process. With
+    invariant=True the bytes do not depend on when or where they were
+    rendered, so parallel output equals serial output.
+    """
+    workers = workers or PDF_WORKERS
+    names = [name for name, _ in named_payloads]
+    payloads = [payload for _, payload in named_payloads]
+
+    if workers <= 1 or len(payloads) <= 1:
+        results = (render_payload(p, debug, invariant) for p in payloads)
+    else:
+        pool = _executor()
+        results = pool.map(render_payload, payloads,
+                           [debug] * len(payloads), [invariant] * len(payloads))
+    return zip(names, results)
+
+
+def render_payloads(named_payloads, workers=None, debug=False, invariant=False):
+    """Render [(file_name, payload)] to [(file_name, pdf_bytes)], keeping input order"""
+    return list(iter_render_payloads(named_payloads, workers=workers, debug=debug, invariant=invariant))
+
+
+def export_range(db, user_id, start_date, end_date, header, debug=False, workers=None, logs=None):
+    """Render one PDF per month of [start_date, end_date]: [(file_name, pdf_bytes)] in month order"""
+    payloads = range_payloads(db, user_id, start_date, end_date, header, logs=logs)
+    return render_payloads(payloads, workers=workers, debug=debug)
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object collecting what zipfile writes"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(files):
+    """Yield a ZIP archive of (file_name, data) pairs piece by piece, one entry at a time.
+
+    `files` may be lazy (e.g. iter_render_payloads): each entry is sent as
+    soon as it exists instead of after the whole archive is built.
+    """
+    sink = _ChunkSink()
+    # Unseekable output: zipfile writes sizes in data descriptors after each entry
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as zf:
+        for file_name, data in files:
+            zf.writestr(file_name, data)
+            yield sink.take()
+    yield sink.take() # Central directory
+
+
+def bundle_zip(files):
+    """ZIP archive bytes with the given (file_name, data) pairs in its root"""
+    buffer = io.BytesIO()
+    # PDFs are already compressed: store them as-is
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as zf:
+        for file_name, data in files:
+            zf.writestr(file_name, data)
+    return buffer.getvalue()
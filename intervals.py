@@ -0,0 +1,192 @@
+"""Sorted container of one day's sleep segments.
+
+Segments are kept in parallel arrays sorted by start minute: start / end
+minute offsets and a type code (index into the container's type labels).
+Each layer (In-bed, and the Deep/Doze/Awake states drawn inside it) also
+keeps its midnight-split pieces sorted, so an insert finds its neighbours
+with bisect instead of rescanning the day.
+
+Shared by the daily-entry page (insert with overlap rejection, remove),
+summarize_day (merged coverage) and the PDF payload (midnight split).
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from models import MINUTES_PER_DAY
+
+# Daily-entry choices (also what populate_data.py writes)
+SEGMENT_TYPES = ("In-bed (布団に入っている)", "Deep Sleep (ぐっすり)", "Doze (うとうと)", "Awake (眠れない)")
+
+KIND_IN_BED, KIND_DEEP, KIND_DOZE, KIND_AWAKE = range(4)
+SLEEP_KINDS = (KIND_DEEP, KIND_DOZE)
+
+# Layers: overlap is only an error within a layer
+IN_BED, STATE = 0, 1
+
+Segment = namedtuple('Segment', ['segment_type', 'start_min', 'end_min'])
+
+
+def segment_kind(s_type):
+    """KIND_* code of a segment type label (matched by keyword), None if unknown"""
+    if "In-bed" in s_type: return KIND_IN_BED
+    if "Deep" in s_type: return KIND_DEEP
+    if "Doze" in s_type: return KIND_DOZE
+    if "Awake" in s_type: return KIND_AWAKE
+    return None
+
+
+def segment_layer(s_type):
+    """IN_BED / STATE / None (unknown type)"""
+    kind = segment_kind(s_type)
+    if kind is None:
+        return None
+    return IN_BED if kind == KIND_IN_BED else STATE
+
+
+def split_midnight(start_min, end_min):
+    """[start, end) pieces on the day's 0-1440 axis; end < start wraps past midnight"""
+    if end_min < start_min:
+        return [(start_min, MINUTES_PER_DAY)] + ([(0, end_min)] if end_min > 0 else [])
+    return [(start_min, end_min)]
+
+
+def merged_minutes(pieces):
+    """Minutes covered by (start, end) pieces, overlaps counted once"""
+    total = 0
+    cur_start = cur_end = None
+    for start, end in sorted(pieces):
+        if cur_end is not None and start <= cur_end:
+            cur_end = max(cur_end, end)
+            continue
+        if cur_end is not None:
+            total += cur_end - cur_start
+        cur_start, cur_end = start, end
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total
+
+
+class DayIntervals:
+    """One day's segments, sorted by start; iterates as Segment tuples"""
+
+    def __init__(self):
+        self._starts = array('H')
+        self._ends = array('H')
+        self._codes = array('B')
+        self._labels = list(SEGMENT_TYPES)
+        self._kinds = [segment_kind(label) for label in SEGMENT_TYPES]
+        # layer -> (piece starts, piece ends), sorted by start
+        self._pieces = {IN_BED: (array('H'), array('H')), STATE: (array('H'), array('H'))}
+        self.overlapping = False # Loaded unchecked with overlaps: conflicts are found by scanning
+        self.rejected = [] # (Segment, reason key) from_segments could not load
+
+    @classmethod
+    def from_segments(cls, segments, strict=True):
+        """Container of (segment_type, start_min, end_min) rows.
+
+        strict: segments insert would refuse (overlap, zero length) go to
+        .rejected. Otherwise stored days are taken as they are (summaries,
+        PDF). Unparseable times (None) are always rejected.
+        """
+        intervals = cls()
+        for s_type, start_min, end_min in segments:
+            try:
+                intervals.insert(s_type, start_min, end_min, check=strict)
+            except ValueError as e:
+                intervals.rejected.append((Segment(s_type, start_min, end_min), str(e)))
+        return intervals
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __getitem__(self, index):
+        return Segment(self._labels[self._codes[index]], self._starts[index], self._ends[index])
+
+    def __iter__(self):
+        for index in range(len(self._starts)):
+            yield self[index]
+
+    def _code(self, s_type):
+        try:
+            return self._labels.index(s_type)
+        except ValueError:
+            self._labels.append(s_type)
+            self._kinds.append(segment_kind(s_type))
+            return len(self._labels) - 1
+
+    def _layer(self, code):
+        kind = self._kinds[code]
+        if kind is None:
+            return None
+        return IN_BED if kind == KIND_IN_BED else STATE
+
+    def _conflicts(self, layer, start, end):
+        starts, ends = self._pieces[layer]
+        if self.overlapping:
+            return any(s < end and start < e for s, e in zip(starts, ends))
+        # Pieces of a layer are disjoint: only the neighbours can overlap
+        i = bisect_right(starts, start)
+        return (i > 0 and ends[i - 1] > start) or (i < len(starts) and starts[i] < end)
+
+    def insert(self, s_type, start_min, end_min, check=True):
+        """Add a segment, O(log n) search; returns its index.
+
+        Raises ValueError('invalid_time') for None minutes and, with check,
+        ValueError('invalid_duration') / ValueError('overlapping_segments')
+        (the validation.py keys).
+        """
+        if start_min is None or end_min is None:
+            raise ValueError('invalid_time')
+        code = self._code(s_type)
+        layer = self._layer(code)
+        pieces = split_midnight(start_min, end_min)
+        if layer is not None:
+            conflict = any(self._conflicts(layer, s, e) for s, e in pieces)
+            if check and start_min == end_min:
+                raise ValueError('invalid_duration')
+            if check and conflict:
+                raise ValueError('overlapping_segments')
+            self.overlapping = self.overlapping or conflict
+            starts, ends = self._pieces[layer]
+            for s, e in pieces:
+                i = bisect_right(starts, s)
+                starts.insert(i, s)
+                ends.insert(i, e)
+        elif check and start_min == end_min:
+            raise ValueError('invalid_duration')
+
+        index = bisect_right(self._starts, start_min)
+        self._starts.insert(index, start_min)
+        self._ends.insert(index, end_min)
+        self._codes.insert(index, code)
+        return index
+
+    def remove(self, index):
+        """Remove and return the segment at `index` (iteration order)"""
+        segment = self[index]
+        del self._starts[index]
+        del self._ends[index]
+        layer = self._layer(self._codes.pop(index))
+        if layer is not None:
+            starts, ends = self._pieces[layer]
+            for s, e in split_midnight(segment.start_min, segment.end_min):
+                i = bisect_left(starts, s)
+                while ends[i] != e:
+                    i += 1
+                del starts[i]
+                del ends[i]
+        return segment
+
+    def pieces(self):
+        """Segments split at midnight onto the day's 0-24h axis (how the PDF draws them)"""
+        for segment in self:
+            for start, end in split_midnight(segment.start_min, segment.end_min):
+                yield Segment(segment.segment_type, start, end)
+
+    def coverage(self, kinds):
+        """Minutes covered by segments of the given KIND_* codes, overlaps counted once"""
+        return merged_minutes(
+            piece
+            for index in range(len(self._starts)) if self._kinds[self._codes[index]] in kinds
+            for piece in split_midnight(self._starts[index], self._ends[index])
+        )
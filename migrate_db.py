@@ -0,0 +1,143 @@
+"""Bring an existing database up to the current models.py schema.
+
+Every step is idempotent, so this can be re-run safely:
+    python migrate_db.py
+"""
+from sqlalchemy import inspect, text, update, bindparam, func
+from sqlalchemy.orm import Session, selectinload
+from models import engine, init_db, hhmm_to_minutes, SleepLog, SleepSegment, Event, DailySummary
+from summary import refresh_summary
+
+BATCH_SIZE = 1000
+
+# Columns added after the first release: table -> [(column, DDL type)]
+ADDED_COLUMNS = {
+    'sleep_segments': [
+        ('start_min', 'INTEGER'),
+        ('end_min', 'INTEGER'),
+        ('crosses_midnight', 'BOOLEAN'),
+    ],
+    'events': [
+        ('happened_min', 'INTEGER'),
+    ],
+    'daily_summaries': [
+        ('alcohol_count', 'INTEGER'),
+        ('caffeine_count', 'INTEGER'),
+        ('bath_count', 'INTEGER'),
+    ],
+}
+
+
+def add_missing_columns(conn):
+    insp = inspect(conn)
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {c['name'] for c in insp.get_columns(table)}
+        for name, ddl_type in columns:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl_type}"))
+                print(f"Added column {table}.{name}")
+
+
+def _run_batches(conn, stmt, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        conn.execute(stmt, rows[i:i + BATCH_SIZE])
+
+
+def backfill_minutes(conn):
+    """Fill minute offsets for rows written before they existed"""
+    seg = SleepSegment.__table__
+    rows = []
+    for seg_id, start_at, end_at in conn.execute(
+        seg.select().with_only_columns(seg.c.id, seg.c.start_at, seg.c.end_at)
+        .where(seg.c.start_min.is_(None) | seg.c.end_min.is_(None))
+    ):
+        start_min = hhmm_to_minutes(start_at)
+        end_min = hhmm_to_minutes(end_at)
+        crosses = None
+        if start_min is not None and end_min is not None:
+            crosses = end_min < start_min
+        rows.append({'_id': seg_id, 'start_min': start_min, 'end_min': end_min, 'crosses': crosses})
+    _run_batches(conn, update(seg).where(seg.c.id == bindparam('_id')).values(
+        start_min=bindparam('start_min'),
+        end_min=bindparam('end_min'),
+        crosses_midnight=bindparam('crosses')
+    ), rows)
+    print(f"Backfilled minutes for {len(rows)} segments")
+
+    evt = Event.__table__
+    rows = [
+        {'_id': evt_id, 'happened_min': hhmm_to_minutes(happened_at)}
+        for evt_id, happened_at in conn.execute(
+            evt.select().with_only_columns(evt.c.id, evt.c.happened_at)
+            .where(evt.c.happened_min.is_(None))
+        )
+    ]
+    _run_batches(conn, update(evt).where(evt.c.id == bindparam('_id')).values(
+        happened_min=bindparam('happened_min')
+    ), rows)
+    print(f"Backfilled minutes for {len(rows)} events")
+
+
+def find_duplicate_days(conn):
+    logs = SleepLog.__table__
+    return conn.execute(
+        logs.select().with_only_columns(logs.c.user_id, logs.c.date, func.count())
+        .group_by(logs.c.user_id, logs.c.date)
+        .having(func.count() > 1)
+    ).fetchall()
+
+
+def create_missing_indexes(conn):
+    """Create the indexes declared in models.py on tables that predate them"""
+    duplicates = find_duplicate_days(conn)
+    if duplicates:
+        for user_id, log_date, count in duplicates:
+            print(f"Duplicate logs: user_id={user_id} date={log_date} ({count} rows)")
+        raise SystemExit("Merge or delete duplicate logs before adding unique(user_id, date).")
+
+    insp = inspect(conn)
+    for model in (SleepLog, SleepSegment, Event):
+        table = model.__table__
+        existing = {ix['name'] for ix in insp.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(conn)
+                print(f"Created index {index.name}")
+
+
+def backfill_summaries(conn):
+    """Create DailySummary rows for logs saved before the table existed; recompute
+    rows from before the alcohol/caffeine/bath counts (added as NULL columns)"""
+    session = Session(bind=conn)
+    total = 0
+    while True:
+        logs = session.query(SleepLog).options(
+            selectinload(SleepLog.segments),
+            selectinload(SleepLog.events)
+        ).filter(
+            ~SleepLog.summary.has() | SleepLog.summary.has(DailySummary.alcohol_count.is_(None))
+        ).order_by(SleepLog.id).limit(BATCH_SIZE).all()
+        if not logs:
+            break
+        for log in logs:
+            refresh_summary(log)
+        session.flush()
+        session.expunge_all()
+        total += len(logs)
+    session.close()
+    print(f"Backfilled summaries for {total} logs")
+
+
+def migrate():
+    # New tables are created as-is; existing ones get their added columns
+    init_db()
+    with engine.begin() as conn:
+        add_missing_columns(conn)
+        backfill_minutes(conn)
+        create_missing_indexes(conn)
+        backfill_summaries(conn)
+    print("Migration complete!")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,9 +1,32 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, ForeignKey, Text
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, event, Column, Integer, String, Date, Time, ForeignKey, Text, Boolean, Index
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, validates
 from datetime import datetime, date, time
 
 Base = declarative_base()
 
+MINUTES_PER_DAY = 24 * 60
+
+def hhmm_to_minutes(value):
+    """'HH:MM' -> minute of day (0-1439), None if malformed"""
+    try:
+        h, m = value.split(":")
+        h, m = int(h), int(m)
+    except (AttributeError, ValueError):
+        return None
+    if not (0 <= h < 24 and 0 <= m < 60):
+        return None
+    return h * 60 + m
+
+def minutes_to_hhmm(minutes):
+    """minute of day -> 'HH:MM' (the stored form)"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def span_minutes(start_min, end_min):
+    """Duration of a start/end pair, wrapping past midnight when end < start"""
+    if end_min < start_min:
+        end_min += MINUTES_PER_DAY
+    return end_min - start_min
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
@@ -28,6 +51,12 @@ class SleepLog(Base):
     user = relationship("User", back_populates="logs")
     segments = relationship("SleepSegment", back_populates="log", cascade="all, delete-orphan")
     events = relationship("Event", back_populates="log", cascade="all, delete-orphan")
+    summary = relationship("DailySummary", back_populates="log", uselist=False, cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # One log per user per day; also serves (user_id, date) range scans
+        Index('uq_sleep_logs_user_date', 'user_id', 'date', unique=True),
+    )
 
 class SleepSegment(Base):
     __tablename__ = 'sleep_segments'
@@ -43,7 +72,30 @@ class SleepSegment(Base):
     start_at = Column(String, nullable=False) # ISO format or something convenient
     end_at = Column(String, nullable=False)
     
+    # Precomputed from start_at/end_at so reads never parse strings
+    # (kept in sync by _sync_minutes, backfilled by migrate_db.py)
+    start_min = Column(Integer) # Minute of day 0-1439
+    end_min = Column(Integer)
+    crosses_midnight = Column(Boolean)
+    
     log = relationship("SleepLog", back_populates="segments")
+    
+    __table_args__ = (
+        Index('ix_sleep_segments_log_start', 'log_id', 'start_min'),
+    )
+    
+    @validates('start_at', 'end_at')
+    def _sync_minutes(self, key, value):
+        minutes = hhmm_to_minutes(value)
+        if key == 'start_at':
+            self.start_min = minutes
+        else:
+            self.end_min = minutes
+        if self.start_min is not None and self.end_min is not None:
+            self.crosses_midnight = self.end_min < self.start_min
+        else:
+            self.crosses_midnight = None # Unknown while either time is malformed
+        return value
 
 class Event(Base):
     __tablename__ = 'events'
@@ -53,8 +105,49 @@ class Event(Base):
     # Types: 'medication', 'toilet', 'alcohol', 'caffeine', etc
     event_type = Column(String, nullable=False)
     happened_at = Column(String, nullable=False) # ISO time string
+    happened_min = Column(Integer) # Minute of day, precomputed from happened_at
     
     log = relationship("SleepLog", back_populates="events")
+    
+    __table_args__ = (
+        Index('ix_events_log_happened', 'log_id', 'happened_min'),
+    )
+    
+    @validates('happened_at')
+    def _sync_minutes(self, key, value):
+        self.happened_min = hhmm_to_minutes(value)
+        return value
+
+class DailySummary(Base):
+    """Per-day totals derived from a log's segments/events (see summary.py)"""
+    __tablename__ = 'daily_summaries'
+    id = Column(Integer, primary_key=True)
+    log_id = Column(Integer, ForeignKey('sleep_logs.id'), nullable=False, unique=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    date = Column(Date, nullable=False)
+    
+    total_sleep_min = Column(Integer, nullable=False, default=0) # Deep + Doze
+    in_bed_min = Column(Integer, nullable=False, default=0)
+    awake_min = Column(Integer, nullable=False, default=0)
+    
+    # Event counts by type (one per calendar badge)
+    sleep_med_count = Column(Integer, nullable=False, default=0)
+    other_med_count = Column(Integer, nullable=False, default=0)
+    alcohol_count = Column(Integer, nullable=False, default=0)
+    caffeine_count = Column(Integer, nullable=False, default=0)
+    bath_count = Column(Integer, nullable=False, default=0)
+    toilet_count = Column(Integer, nullable=False, default=0)
+    other_event_count = Column(Integer, nullable=False, default=0)
+    
+    # Completion status: comma separated required-missing keys, '' when complete
+    missing_fields = Column(String, nullable=False, default="")
+    is_complete = Column(Boolean, nullable=False, default=False)
+    
+    log = relationship("SleepLog", back_populates="summary")
+    
+    __table_args__ = (
+        Index('uq_daily_summaries_user_date', 'user_id', 'date', unique=True),
+    )
 
 # Database Setup
 import os
@@ -81,10 +174,36 @@ if not database_url:
 if database_url and database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
+# Connection tuning (environment overrides)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800)) # Seconds; below typical server/proxy idle timeouts
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no')
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+def _configure_sqlite(dbapi_conn, connection_record):
+    """Per-connection SQLite settings so concurrent sessions wait instead of failing"""
+    cursor = dbapi_conn.cursor()
+    # Readers no longer block the writer (and vice versa); persistent in the DB file
+    cursor.execute("PRAGMA journal_mode=WAL")
+    # Safe with WAL: only the last commits can be lost on power failure, never corrupted
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Wait for the write lock instead of raising "database is locked" at once
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
 if database_url.startswith("sqlite"):
     engine = create_engine(database_url, connect_args={'check_same_thread': False}, echo=False)
+    event.listen(engine, "connect", _configure_sqlite)
 else:
-    engine = create_engine(database_url, echo=False)
+    engine = create_engine(
+        database_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=DB_POOL_PRE_PING, # Drop connections the server closed while idle
+        pool_recycle=DB_POOL_RECYCLE,
+        echo=False
+    )
 SessionLocal = sessionmaker(bind=engine)
 
 def init_db():
@@ -0,0 +1,147 @@
+"""Process-wide cache of per-user month data for the Streamlit pages.
+
+Streamlit reruns the whole script on every widget interaction; with the
+month cache a rerun that only redraws already-loaded months issues no
+queries. Entries are keyed (user_id, year, month) and hold plain snapshots
+(no ORM objects), so they outlive the per-run DB session and can be shared
+between sessions.
+
+Writers in this process invalidate the months they touch (see
+SleepRepository.commit). MONTH_CACHE_TTL bounds how long writes from other
+processes (populate_data.py, data_io.py CLI) can stay invisible.
+"""
+import calendar
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import date
+
+# Entry cap, not a byte bound: at most this many user-months are kept, each
+# <= 31 day snapshots whose size grows with the day's segment/event count
+MONTH_CACHE_MONTHS = int(os.getenv('MONTH_CACHE_MONTHS', 512))
+MONTH_CACHE_TTL = int(os.getenv('MONTH_CACHE_TTL', 300)) # Seconds
+
+SegmentSnapshot = namedtuple('SegmentSnapshot', ['segment_type', 'start_at', 'end_at', 'start_min', 'end_min', 'crosses_midnight'])
+EventSnapshot = namedtuple('EventSnapshot', ['event_type', 'happened_at', 'happened_min'])
+SummarySnapshot = namedtuple('SummarySnapshot', [
+    'total_sleep_min', 'in_bed_min', 'awake_min',
+    'sleep_med_count', 'other_med_count', 'alcohol_count', 'caffeine_count', 'bath_count',
+    'toilet_count', 'other_event_count',
+    'missing_fields', 'is_complete'
+])
+# Same attribute names as SleepLog, so readers (calendar, export.build_month_payload) take either
+DaySnapshot = namedtuple('DaySnapshot', ['date', 'sleepiness', 'memo', 'toilet_count', 'segments', 'events', 'summary'])
+
+
+def snapshot_log(log, summary):
+    """DaySnapshot of a SleepLog with children loaded; summary: its DailySummary (or a transient one)"""
+    return DaySnapshot(
+        date=log.date,
+        sleepiness=log.sleepiness,
+        memo=log.memo,
+        toilet_count=log.toilet_count,
+        segments=tuple(
+            SegmentSnapshot(s.segment_type, s.start_at, s.end_at, s.start_min, s.end_min, s.crosses_midnight)
+            for s in log.segments
+        ),
+        events=tuple(EventSnapshot(e.event_type, e.happened_at, e.happened_min) for e in log.events),
+        summary=SummarySnapshot(**{f: getattr(summary, f) for f in SummarySnapshot._fields})
+    )
+
+
+def month_bounds(year, month):
+    # monthrange instead of stepping into the next month: fine for December 9999
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def months_between(start_date, end_date):
+    """(year, month) pairs overlapping [start_date, end_date]"""
+    year, month = start_date.year, start_date.month
+    while (year, month) <= (end_date.year, end_date.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class MonthCache:
+    """LRU of {date: DaySnapshot} per (user_id, year, month), safe across session threads"""
+
+    def __init__(self, max_months=MONTH_CACHE_MONTHS, ttl=MONTH_CACHE_TTL):
+        self.max_months = max_months
+        self.ttl = ttl
+        self._entries = OrderedDict() # key -> (loaded_at, days); oldest use first
+        self._generations = {} # user_id -> bumped on every invalidation
+        self._clears = 0 # Bumped by clear(): every user's generation at once
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id, year, month, loader):
+        """Cached month, or loader() -> {date: DaySnapshot} stored on a miss"""
+        key = (user_id, year, month)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation(user_id)
+
+        # Load outside the lock so other sessions are not blocked on the DB
+        days = loader()
+
+        with self._lock:
+            # A save committed while we were loading may not be in `days`: don't store it
+            if self._generation(user_id) == generation:
+                self._entries[key] = (now, days)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_months:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return days
+
+    def _generation(self, user_id):
+        # Callers hold the lock
+        return self._clears, self._generations.get(user_id, 0)
+
+    def invalidate(self, user_id, days):
+        """Drop the months containing `days` (dates) of a user"""
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for day in set((d.year, d.month) for d in days):
+                if self._entries.pop((user_id,) + day, None) is not None:
+                    self.invalidations += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            # Loads already running must not store what they read before the clear
+            self._clears += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'months': len(self._entries),
+                'days': sum(len(days) for _, days in self._entries.values()),
+            }
+
+
+# Shared by all sessions of the Streamlit server process
+month_cache = MonthCache()
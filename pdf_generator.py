@@ -1,24 +1,58 @@
 import io
 import os
+import copy
+from functools import lru_cache
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import black, red, blue
-from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
-import pandas as pd
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
 import numpy as np
-from datetime import datetime, timedelta
+from pdf_layout import MEMO_WRAP_WIDTH, MEMO_MAX_LINES
 
-# Register Japanese Font
-pdfmetrics.registerFont(UnicodeCIDFont('HeiseiKakuGo-W5'))
+# This module is the heavy part of the app (reportlab, numpy, CID font):
+# app.py imports it only when the PDF page is opened.
+
+@lru_cache(maxsize=None)
+def _register_fonts():
+    """Register the Japanese font on first PDF render instead of at import"""
+    pdfmetrics.registerFont(UnicodeCIDFont('HeiseiKakuGo-W5'))
 
 # Constants for A4 Portrait calculated in points (1pt = 1/72 inch)
 PAGE_WIDTH, PAGE_HEIGHT = A4
 
+TEMPLATE_FORM_NAME = "template_bg"
+HATCH_FORM_NAME = "doze_hatch"
+HATCH_STEP = 3 # density of Doze hatching (pt between lines)
+ARROW_LEFT_FORM_NAME = "arrow_left"
+ARROW_RIGHT_FORM_NAME = "arrow_right"
+MARKER_FORM_NAMES = {"▲": "marker_sleep_med", "▽": "marker_toilet", "●": "marker_other"}
+
+# Segment style codes used by the layout stage
+SEG_IN_BED, SEG_DEEP, SEG_DOZE, SEG_AWAKE, SEG_FILL = range(5)
+
+def _segment_kind(s_type):
+    if 'In-bed' in s_type: return SEG_IN_BED
+    if 'Deep' in s_type: return SEG_DEEP
+    if 'Doze' in s_type: return SEG_DOZE
+    if 'Awake' in s_type: return SEG_AWAKE
+    return SEG_FILL
+
+def _event_symbol(t_type):
+    if "sleep_med" in t_type: return "▲"
+    if "toilet" in t_type: return "▽"
+    return "●"
+
+@lru_cache(maxsize=4)
+def _load_template_xobject(path, mtime):
+    """Decode + compress the template image once per process (mtime busts the cache)"""
+    return PDFImageXObject(TEMPLATE_FORM_NAME, path)
+
 class SleepPDFGenerator:
-    def __init__(self):
-        self.packet = io.BytesIO()
+    def __init__(self, invariant=False):
+        # invariant: fixed creation date / document ID so identical input gives identical bytes
+        self.invariant = invariant
         self.template_path = "assets/template.png"
         
         # Template Image Dimensions (PX) - Measured from file
@@ -79,12 +113,18 @@ class SleepPDFGenerator:
         # Invert axis
         return PAGE_HEIGHT - scaled_y
 
-    def generate(self, segments, daily_logs, user_info, output_path, debug=False):
-        c = canvas.Canvas(output_path, pagesize=A4)
+    def generate(self, segments, daily_logs, user_info, output=None, debug=False):
+        """Render the report in memory and return the PDF bytes.
+        
+        output: optional file path or writable file-like object that also receives the bytes
+        """
+        _register_fonts()
+        buffer = io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4, invariant=self.invariant)
         
         # 1. Draw Template Background
         if os.path.exists(self.template_path):
-            c.drawImage(self.template_path, 0, 0, width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            self._draw_template(c)
         else:
             c.drawString(100, 500, "Template not found at assets/template.png")
             
@@ -103,6 +143,28 @@ class SleepPDFGenerator:
             self._draw_pixel_grid(c)
             
         c.save()
+        pdf_bytes = buffer.getvalue()
+        
+        if output is not None:
+            if isinstance(output, (str, os.PathLike)):
+                with open(output, "wb") as f:
+                    f.write(pdf_bytes)
+            else:
+                output.write(pdf_bytes)
+        return pdf_bytes
+        
+    def _draw_template(self, c):
+        """Draw the cached template image (same output as c.drawImage, without re-encoding it)"""
+        xobj = _load_template_xobject(self.template_path, os.path.getmtime(self.template_path))
+        # ReportLab binds an XObject to the document it is registered in, so each
+        # document gets a shallow copy sharing the compressed stream bytes
+        c._doc.addForm(TEMPLATE_FORM_NAME, copy.copy(xobj))
+        
+        # Image XObjects fill the unit square: scale it to the page
+        c.saveState()
+        c.scale(PAGE_WIDTH, PAGE_HEIGHT)
+        c.doForm(TEMPLATE_FORM_NAME)
+        c.restoreState()
         
     def _draw_header(self, c, info):
         # Font size reduced (14 -> 8)
@@ -129,70 +191,127 @@ class SleepPDFGenerator:
         x = self._px_to_pdf_x(self.HEADER_MONTH_X)
         c.drawString(x, y_pdf, str(info.get('month', '')))
         
+    def _hours_to_px_x(self, hours):
+        """Convert hour of day (scalar or array) to Image Pixel X on the time axis"""
+        total_hours = self.TIME_END_NOTATION - self.TIME_START_NOTATION
+        x_width_px = self.X_TIME_END_PX - self.X_TIME_START_PX
+        offset = hours - self.TIME_START_NOTATION
+        return self.X_TIME_START_PX + (x_width_px * (offset / total_hours))
+
+    def _valid_day_mask(self, day_index):
+        return (day_index >= 0) & (day_index <= 30) & (day_index < len(self.DAILY_Y_STARTS))
+
+    def _layout_segments(self, data):
+        """Vectorized geometry for a month of segments.
+        
+        Returns PDF coordinate lists (one entry per drawable segment, input order kept)
+        and the SEG_* style code of each.
+        """
+        n = len(data)
+        day_index = np.fromiter((seg['day_index'] for seg in data), dtype=np.int64, count=n)
+        start_hour = np.fromiter((seg['start_hour'] for seg in data), dtype=np.float64, count=n)
+        end_hour = np.fromiter((seg['end_hour'] for seg in data), dtype=np.float64, count=n)
+        kind = np.fromiter((_segment_kind(seg.get('type', 'In-bed')) for seg in data), dtype=np.int8, count=n)
+        
+        valid = self._valid_day_mask(day_index)
+        day_index, start_hour, end_hour, kind = day_index[valid], start_hour[valid], end_hour[valid], kind[valid]
+        
+        # --- Y from the calibrated row list, X from hours ---
+        y_top_px = np.asarray(self.DAILY_Y_STARTS, dtype=np.float64)[day_index]
+        x_start = self._px_to_pdf_x(self._hours_to_px_x(start_hour))
+        x_end = self._px_to_pdf_x(self._hours_to_px_x(end_hour))
+        
+        # LOWER HALF: arrow line approx 45px from row top
+        y_arrow = self._px_to_pdf_y(y_top_px + 45)
+        # UPPER HALF: bar 18px high, offset 4px from row top
+        y_bar_top = self._px_to_pdf_y(y_top_px + 4)
+        y_bar_bottom = self._px_to_pdf_y(y_top_px + 4 + 18)
+        
+        return {
+            'kind': kind.tolist(),
+            'x_start': x_start.tolist(),
+            'x_end': x_end.tolist(),
+            'width': (x_end - x_start).tolist(),
+            'y_arrow': y_arrow.tolist(),
+            'y_bar_bottom': y_bar_bottom.tolist(),
+            'y_bar_top': y_bar_top.tolist(),
+            'bar_height': (y_bar_top - y_bar_bottom).tolist(),
+        }
+
+    def _layout_events(self, daily_logs):
+        """Vectorized marker positions for a month of events: (x list, y list, symbol list)"""
+        day_list, hour_list, symbols = [], [], []
+        for day_index, log in daily_logs.items():
+            for evt in log.get('events', []):
+                day_list.append(day_index)
+                hour_list.append(evt['time'])
+                symbols.append(_event_symbol(evt.get('type', '')))
+        
+        day_index = np.asarray(day_list, dtype=np.int64)
+        valid = self._valid_day_mask(day_index)
+        day_index = day_index[valid]
+        hours = np.asarray(hour_list, dtype=np.float64)[valid]
+        symbols = [sym for sym, ok in zip(symbols, valid.tolist()) if ok]
+        
+        y_top_px = np.asarray(self.DAILY_Y_STARTS, dtype=np.float64)[day_index]
+        # Glyph drawn 3pt left of the time so it is centred on it
+        x = self._px_to_pdf_x(self._hours_to_px_x(hours)) - 3
+        # Markers sit on the In-bed arrow line (y_top_px + 45)
+        y = self._px_to_pdf_y(y_top_px + 45)
+        return x.tolist(), y.tolist(), symbols
+
     def _draw_daily_metrics_and_events(self, c, daily_logs):
         if not daily_logs:
             return
             
         import textwrap
         
+        rows = []
         for day_index, log in daily_logs.items():
             if day_index < 0 or day_index > 30: continue
             
             # Y Base from List
             if day_index >= len(self.DAILY_Y_STARTS): continue
-            y_top_px = self.DAILY_Y_STARTS[day_index]
-            
-            # --- Sleepiness ---
+            rows.append((self.DAILY_Y_STARTS[day_index], log))
+        
+        # Text is grouped by font size so each font is selected once per page
+        c.setFillColor(black)
+        
+        # --- Sleepiness ---
+        c.setFont("HeiseiKakuGo-W5", 10) # Standard
+        sx = self._px_to_pdf_x(self.X_SLEEPINESS_START)
+        for y_top_px, log in rows:
             if log.get('sleepiness'):
-                c.setFont("HeiseiKakuGo-W5", 10) # Standard
-                c.setFillColor(black)
-                sx = self._px_to_pdf_x(self.X_SLEEPINESS_START)
                 sy = self._px_to_pdf_y(y_top_px + 40) 
                 c.drawString(sx, sy, str(log['sleepiness']))
-            
+        
+        c.setFont("HeiseiKakuGo-W5", 6) # Small font
+        mx = self._px_to_pdf_x(self.X_NOTE_START)
+        for y_top_px, log in rows:
             # --- Memo (Small font + Wrap) ---
             if log.get('memo'):
-                c.setFont("HeiseiKakuGo-W5", 6) # Small font
-                mx = self._px_to_pdf_x(self.X_NOTE_START)
                 my_base = self._px_to_pdf_y(y_top_px + 15) # Start higher
                 
                 # Wrap text (approx 20 chars per line - adjusted for single line sleep time)
-                lines = textwrap.wrap(log['memo'], width=20)
+                lines = textwrap.wrap(log['memo'], width=MEMO_WRAP_WIDTH)
                 
-                for i, line in enumerate(lines[:3]): # Max 3 lines
+                for i, line in enumerate(lines[:MEMO_MAX_LINES]): # Max 3 lines (longer memos: W4 warning)
                     c.drawString(mx, my_base - (i * 7), line)
 
             # --- Total Sleep Time (Separate Line) ---
             if log.get('total_sleep'):
-                 c.setFont("HeiseiKakuGo-W5", 6)
-                 tx = self._px_to_pdf_x(self.X_NOTE_START)
                  # Position near bottom of the row (Height ~64px)
                  ty = self._px_to_pdf_y(y_top_px + 55) 
-                 c.drawString(tx, ty, str(log['total_sleep']))
-                
-            # --- Events ---
-            events = log.get('events', [])
-            c.setFont("HeiseiKakuGo-W5", 10) # Restore
-            for evt in events:
-                # Logic same as _draw_data for X
-                total_hours = self.TIME_END_NOTATION - self.TIME_START_NOTATION
-                x_width_px = self.X_TIME_END_PX - self.X_TIME_START_PX
-                
-                offset = evt['time'] - self.TIME_START_NOTATION
-                px_x = self.X_TIME_START_PX + (x_width_px * (offset / total_hours))
-                pdf_x = self._px_to_pdf_x(px_x)
+                 c.drawString(mx, ty, str(log['total_sleep']))
                 
-                # Y position - moved to In-bed row (lower half)
-                # In-bed arrow line is at y_top_px + 45. Align markers there.
-                pdf_y = self._px_to_pdf_y(y_top_px + 45)
-                
-                # Symbol
-                symbol = "●"
-                t_type = evt.get('type', '')
-                if "sleep_med" in t_type: symbol = "▲"
-                elif "toilet" in t_type: symbol = "▽"
-                
-                c.drawString(pdf_x - 3, pdf_y, symbol)
+        # --- Events (whole month laid out in one pass, glyphs placed as forms) ---
+        xs, ys, symbols = self._layout_events(daily_logs)
+        for x, y, symbol in zip(xs, ys, symbols):
+            form_name = self._marker_form(c, symbol)
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(form_name)
+            c.restoreState()
 
     def _draw_data(self, c, data):
         """Draw sleep data bars from actual data"""
@@ -202,118 +321,115 @@ class SleepPDFGenerator:
         if not data:
             return
 
-        for segment in data:
-            day_index = segment['day_index']
-            # Safety check
-            if day_index < 0 or day_index > 30:
-                continue
-
-            # --- Y Coordinate Calculation from List ---
-            if day_index >= len(self.DAILY_Y_STARTS): continue
-            y_top_px = self.DAILY_Y_STARTS[day_index]
-            
-            # --- X Coordinate Calculation ---
-            total_hours = self.TIME_END_NOTATION - self.TIME_START_NOTATION
-            x_width_px = self.X_TIME_END_PX - self.X_TIME_START_PX
-            
-            # Helper to calculate pixel X from hour
-            def get_px_x(h):
-                # Normalize overlaps (e.g. 25:00 -> 25.0)
-                offset = h - self.TIME_START_NOTATION
-                return self.X_TIME_START_PX + (x_width_px * (offset / total_hours))
-
-            start_hour = segment['start_hour']
-            end_hour = segment['end_hour']
-            
-            x_start_px = get_px_x(start_hour)
-            x_end_px = get_px_x(end_hour)
-            
-            pdf_x_start = self._px_to_pdf_x(x_start_px)
-            pdf_x_end = self._px_to_pdf_x(x_end_px)
-            pdf_w = pdf_x_end - pdf_x_start
-            
-            # Set Color based on type
-            s_type = segment.get('type', 'In-bed')
+        layout = self._layout_segments(data)
+        
+        doze_widths = [w for kind, w in zip(layout['kind'], layout['width']) if kind == SEG_DOZE]
+        if doze_widths and not c.hasForm(HATCH_FORM_NAME):
+            bar_h = layout['bar_height'][layout['kind'].index(SEG_DOZE)]
+            self._define_hatch_form(c, max(doze_widths), bar_h)
+        if SEG_IN_BED in layout['kind']:
+            self._define_arrow_forms(c)
+        
+        # Unified Color: Blue (set once; only the line width varies by type)
+        c.setStrokeColor(blue)
+        c.setFillColor(blue)
+        line_width = None
+        
+        for kind, pdf_x_start, pdf_x_end, pdf_w, pdf_y_arrow, pdf_y_bottom, pdf_y_top, pdf_h in zip(
+            layout['kind'], layout['x_start'], layout['x_end'], layout['width'],
+            layout['y_arrow'], layout['y_bar_bottom'], layout['y_bar_top'], layout['bar_height']
+        ):
+            # Emit line width changes only when the width actually differs
+            width = {SEG_IN_BED: 1.5, SEG_AWAKE: 1.0}.get(kind, 0.5)
+            if width != line_width:
+                c.setLineWidth(width)
+                line_width = width
             
             # --- Draw Logic ---
-            if 'In-bed' in s_type:
+            if kind == SEG_IN_BED:
                 # LOWER HALF: Arrow Line
-                # Y position for the arrow line (approx 45px from top, in the lower frame)
-                arrow_y_offset = 45 
-                y_arrow_px = y_top_px + arrow_y_offset
-                pdf_y_arrow = self._px_to_pdf_y(y_arrow_px)
-                
-                c.setStrokeColor(blue)
-                c.setLineWidth(1.5)
                 c.line(pdf_x_start, pdf_y_arrow, pdf_x_end, pdf_y_arrow)
                 
-                # Draw Arrowheads (manual)
-                arrow_size = 3
-                # Left Arrow (<)
-                p = c.beginPath()
-                p.moveTo(pdf_x_start + arrow_size, pdf_y_arrow + arrow_size)
-                p.lineTo(pdf_x_start, pdf_y_arrow)
-                p.lineTo(pdf_x_start + arrow_size, pdf_y_arrow - arrow_size)
-                c.drawPath(p, stroke=1, fill=0)
+                # Arrowheads: shared forms placed at both ends
+                c.saveState()
+                c.translate(pdf_x_start, pdf_y_arrow)
+                c.doForm(ARROW_LEFT_FORM_NAME)
+                c.translate(pdf_w, 0)
+                c.doForm(ARROW_RIGHT_FORM_NAME)
+                c.restoreState()
                 
-                # Right Arrow (>)
-                p = c.beginPath()
-                p.moveTo(pdf_x_end - arrow_size, pdf_y_arrow + arrow_size)
-                p.lineTo(pdf_x_end, pdf_y_arrow)
-                p.lineTo(pdf_x_end - arrow_size, pdf_y_arrow - arrow_size)
-                c.drawPath(p, stroke=1, fill=0)
-                
-            else:
+            elif kind == SEG_DEEP:
                 # UPPER HALF: Texture/Shape Representation
-                # Y position (offset 4px from top)
-                bar_height_px = 18
-                y_offset_px = 4
-                y_bar_top_px = y_top_px + y_offset_px
-                img_bar_bottom_px = y_bar_top_px + bar_height_px
+                # 1. ぐっすり -> 塗りつぶし (Solid Fill)
+                c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=0, fill=1)
                 
-                pdf_y_bottom = self._px_to_pdf_y(img_bar_bottom_px)
-                pdf_y_top = self._px_to_pdf_y(y_bar_top_px)
-                pdf_h = pdf_y_top - pdf_y_bottom
+            elif kind == SEG_DOZE:
+                # 2. うとうと -> 斜線 (Diagonal Hatching)
+                self._draw_doze(c, pdf_x_start, pdf_y_bottom, pdf_w, pdf_h)
                 
-                # Unified Color: Blue
-                c.setStrokeColor(blue)
-                c.setFillColor(blue)
-                c.setLineWidth(0.5)
-                
-                if 'Deep' in s_type:
-                    # 1. ぐっすり -> 塗りつぶし (Solid Fill)
-                    c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=0, fill=1)
-                    
-                elif 'Doze' in s_type:
-                    # 2. うとうと -> 斜線 (Diagonal Hatching)
-                    # Draw border first
-                    c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=1, fill=0)
-                    
-                    # Create clipping region for lines
-                    c.saveState()
-                    p = c.beginPath()
-                    p.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h)
-                    c.clipPath(p, stroke=0, fill=0)
-                    
-                    # Draw diagonal lines
-                    # Simple 45 degree lines: (x, bottom) -> (x+h, top)
-                    step = 3 # density of hatching
-                    # Start X needs to be shifted left by height to cover the left triangle corner
-                    start_draw_x = int(pdf_x_start - pdf_h)
-                    end_draw_x = int(pdf_x_end)
-                    
-                    for x in range(start_draw_x, end_draw_x, step):
-                        c.line(x, pdf_y_bottom, x + pdf_h, pdf_y_top)
-                        
-                    c.restoreState()
-                    
-                elif 'Awake' in s_type:
-                    # 3. 眠れない -> 枠線のみ (Frame only)
-                    c.setLineWidth(1.0)
-                    c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=1, fill=0)
-                else:
-                    # Fallback -> Solid 
-                    c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=0, fill=1)
+            elif kind == SEG_AWAKE:
+                # 3. 眠れない -> 枠線のみ (Frame only)
+                c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=1, fill=0)
+            else:
+                # Fallback -> Solid 
+                c.rect(pdf_x_start, pdf_y_bottom, pdf_w, pdf_h, stroke=0, fill=1)
+
+    def _define_arrow_forms(self, c):
+        """In-bed arrowheads (< and >) with the tip at the origin, once per document"""
+        if c.hasForm(ARROW_LEFT_FORM_NAME):
+            return
+        arrow_size = 3
+        # Bounding box leaves room for the 1.5pt stroke and its mitered tip
+        margin = 2
+        for name, direction in [(ARROW_LEFT_FORM_NAME, 1), (ARROW_RIGHT_FORM_NAME, -1)]:
+            c.beginForm(name, min(0, direction * arrow_size) - margin, -arrow_size - margin,
+                        max(0, direction * arrow_size) + margin, arrow_size + margin)
+            c.setStrokeColor(blue)
+            c.setLineWidth(1.5)
+            p = c.beginPath()
+            p.moveTo(direction * arrow_size, arrow_size)
+            p.lineTo(0, 0)
+            p.lineTo(direction * arrow_size, -arrow_size)
+            c.drawPath(p, stroke=1, fill=0)
+            c.endForm()
+
+    def _marker_form(self, c, symbol):
+        """Form name for an event glyph (▲ ▽ ●), defining it on first use in the document"""
+        name = MARKER_FORM_NAMES[symbol]
+        if not c.hasForm(name):
+            # 10pt glyph drawn from its baseline origin
+            c.beginForm(name, -2, -4, 14, 14)
+            c.setFont("HeiseiKakuGo-W5", 10)
+            c.setFillColor(black)
+            c.drawString(0, 0, symbol)
+            c.endForm()
+        return name
+
+    def _define_hatch_form(self, c, max_width, bar_h):
+        """Diagonal hatch lines, defined once per document and reused by every Doze bar"""
+        # Lines start up to bar_h left of the bar to cover its left corner
+        form_w = max_width + bar_h + HATCH_STEP
+        c.beginForm(HATCH_FORM_NAME, 0, 0, form_w, bar_h)
+        c.setStrokeColor(blue)
+        c.setLineWidth(0.5)
+        # Simple 45 degree lines: (x, bottom) -> (x+h, top)
+        for x in range(0, int(form_w), HATCH_STEP):
+            c.line(x, 0, x + bar_h, bar_h)
+        c.endForm()
+
+    def _draw_doze(self, c, x, y, w, h):
+        # Draw border first
+        c.rect(x, y, w, h, stroke=1, fill=0)
+        
+        # Hatch form clipped to the bar; integer origin keeps lines on the same
+        # whole-point grid as drawing them one by one
+        c.saveState()
+        p = c.beginPath()
+        p.rect(x, y, w, h)
+        c.clipPath(p, stroke=0, fill=0)
+        c.translate(int(x - h), y)
+        c.doForm(HATCH_FORM_NAME)
+        c.restoreState()
 
     def _draw_pixel_grid(self, c):
         """Draw grid based on Image Pixels"""
@@ -358,4 +474,14 @@ class SleepPDFGenerator:
 
 if __name__ == "__main__":
     gen = SleepPDFGenerator()
-    gen.generate({}, "test_output.pdf", debug=True)
+    gen.generate([], {}, None, "test_output.pdf", debug=True)
+
+
+def render_payload(payload, debug=False, invariant=False):
+    """PDF bytes of a (segments, daily_logs, user_info) tuple.
+
+    The process-pool job of export.py: module-level so it pickles, and in
+    this module so workers only import the PDF stack.
+    """
+    segments, daily_logs, user_info = payload
+    return SleepPDFGenerator(invariant=invariant).generate(segments, daily_logs, user_info, debug=debug)
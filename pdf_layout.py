@@ -0,0 +1,9 @@
+"""Layout constants of the PDF that the app side also needs (validation.py).
+
+Kept free of imports so pdf_generator, which the process-pool workers
+load, does not pull in models.py (streamlit, the engine) through them.
+"""
+
+# Memo cell: wrapped at this many characters, only the first lines are drawn
+MEMO_WRAP_WIDTH = 20
+MEMO_MAX_LINES = 3
@@ -0,0 +1,364 @@
+from sqlalchemy import insert, delete, select, text, func, case, and_, or_, Date
+from sqlalchemy.orm import selectinload, joinedload
+from models import User, SleepLog, SleepSegment, Event, DailySummary, hhmm_to_minutes
+from summary import refresh_summary, summarize_day, summarize_log
+from month_cache import snapshot_log, month_bounds, months_between
+
+# Days per INSERT ... RETURNING round in bulk_insert_days
+BULK_BATCH_SIZE = 500
+
+
+def ensure_user(db, username, creds, fallback_name=None):
+    """(User, created) for an auth-config username; the row is created and committed on first login.
+
+    creds: the username's entry of credentials.usernames in auth_config.yaml
+    """
+    user = db.query(User).filter(User.username == username).first()
+    if user:
+        return user, False
+    user = User(
+        username=username,
+        email=creds.get('email', f"{username}@example.com"),
+        password_hash=creds.get('password', 'stored_in_config'), # Placeholder
+        display_name=creds.get('name', fallback_name)
+    )
+    db.add(user)
+    db.commit()
+    return user, True
+
+
+def _with_children(query):
+    # Load segments/events with one extra SELECT ... IN (...) each instead of
+    # lazy-loading two queries per log.
+    return query.options(
+        selectinload(SleepLog.segments),
+        selectinload(SleepLog.events),
+        joinedload(SleepLog.summary)
+    )
+
+
+def fetch_logs(db, user_id, start_date, end_date):
+    """Logs of a user in [start_date, end_date] with segments/events preloaded (3 queries total)"""
+    return _with_children(db.query(SleepLog)).filter(
+        SleepLog.user_id == user_id,
+        SleepLog.date >= start_date,
+        SleepLog.date <= end_date
+    ).order_by(SleepLog.date).all()
+
+
+def get_log(db, user_id, target_date):
+    """Single day log with segments/events preloaded, or None"""
+    return _with_children(db.query(SleepLog)).filter(
+        SleepLog.user_id == user_id,
+        SleepLog.date == target_date
+    ).first()
+
+
+def _assign(obj, values):
+    # Only touch attributes whose value differs, so unchanged rows stay clean
+    for key, value in values.items():
+        if getattr(obj, key) != value:
+            setattr(obj, key, value)
+
+
+def _sync_children(collection, rows, model, fields):
+    """Make a relationship collection hold exactly `rows` (tuples of `fields` values).
+
+    Rows already stored are left alone, leftover stored rows are rewritten in
+    place for the new values, and only the remainder is deleted or inserted.
+    """
+    pending = list(rows)
+    stale = []
+    for obj in list(collection):
+        key = tuple(getattr(obj, f) for f in fields)
+        if key in pending:
+            pending.remove(key)
+        else:
+            stale.append(obj)
+
+    for obj, key in zip(stale, pending):
+        _assign(obj, dict(zip(fields, key)))
+    for obj in stale[len(pending):]:
+        collection.remove(obj) # delete-orphan cascade deletes the row
+    for key in pending[len(stale):]:
+        collection.append(model(**dict(zip(fields, key))))
+
+
+def save_day(db, user_id, target_date, values, segments, events, log=None):
+    """Stage one day's log as a minimal set of inserts/updates/deletes; the caller commits.
+
+    values: SleepLog column values (sleepiness, memo, toilet_count)
+    segments: [(segment_type, start_at, end_at)] with 'HH:MM' strings
+    events: [(event_type, happened_at)]
+    log: the day's log if already loaded with get_log (saves a query)
+
+    A day whose input matches what is stored produces no writes at all.
+    """
+    if log is None:
+        log = get_log(db, user_id, target_date)
+    if log is None:
+        # Children are attached through the relationships, so the log id is
+        # assigned by the same flush (no intermediate commit)
+        log = SleepLog(user_id=user_id, date=target_date)
+        db.add(log)
+
+    _assign(log, values)
+    _sync_children(log.segments, segments, SleepSegment, ('segment_type', 'start_at', 'end_at'))
+    _sync_children(log.events, events, Event, ('event_type', 'happened_at'))
+    refresh_summary(log)
+    return log
+
+
+def _calendar(db, start_date, end_date):
+    """One row per day of [start_date, end_date] as a subquery with a `day` column"""
+    if db.get_bind().dialect.name == 'postgresql':
+        stmt = text(
+            "SELECT CAST(d AS DATE) AS day "
+            "FROM generate_series(CAST(:cal_start AS DATE), CAST(:cal_end AS DATE), INTERVAL '1 day') AS d"
+        ).bindparams(cal_start=start_date, cal_end=end_date)
+    else:
+        # SQLite stores dates as 'YYYY-MM-DD' text; step with date(..., '+1 day')
+        stmt = text(
+            "WITH RECURSIVE cal(day) AS ("
+            "SELECT :cal_start UNION ALL SELECT date(day, '+1 day') FROM cal WHERE day < :cal_end"
+            ") SELECT day FROM cal"
+        ).bindparams(cal_start=start_date.isoformat(), cal_end=end_date.isoformat())
+    return stmt.columns(day=Date).subquery('calendar')
+
+
+def day_statuses(db, user_id, start_date, end_date):
+    """Input / required-missing flags for every day of [start_date, end_date], in one query.
+
+    Rows (day, has_input, missing_sleepiness, missing_toilet_count,
+    missing_in_bed, missing_segments): a calendar of the range left-joined to
+    the user's logs and their aggregated segment/event counts. The flags
+    follow summarize_day and spec_validation.md B has_any_input; days without
+    a log have has_input false.
+    """
+    logs = SleepLog.__table__
+    seg = SleepSegment.__table__
+    evt = Event.__table__
+    in_range = and_(logs.c.user_id == user_id, logs.c.date >= start_date, logs.c.date <= end_date)
+
+    # Same classification as summarize_day (malformed times skipped, In-bed checked first)
+    valid = and_(seg.c.start_min.isnot(None), seg.c.end_min.isnot(None))
+    is_in_bed = seg.c.segment_type.contains("In-bed")
+    is_state = or_(seg.c.segment_type.contains("Deep"), seg.c.segment_type.contains("Doze"),
+                   seg.c.segment_type.contains("Awake"))
+    seg_counts = select(
+        seg.c.log_id,
+        func.count().label('segments'),
+        func.sum(case((and_(valid, is_in_bed), 1), else_=0)).label('in_bed'),
+        func.sum(case((and_(valid, ~is_in_bed, is_state), 1), else_=0)).label('states'),
+    ).join(logs, logs.c.id == seg.c.log_id).where(in_range).group_by(seg.c.log_id).subquery('seg_counts')
+    evt_counts = select(
+        evt.c.log_id, func.count().label('events')
+    ).join(logs, logs.c.id == evt.c.log_id).where(in_range).group_by(evt.c.log_id).subquery('evt_counts')
+
+    cal = _calendar(db, start_date, end_date)
+    segments = func.coalesce(seg_counts.c.segments, 0)
+    has_log = logs.c.id.isnot(None)
+    has_input = and_(has_log, or_(
+        logs.c.sleepiness.isnot(None),
+        logs.c.toilet_count.isnot(None),
+        func.coalesce(logs.c.memo, "") != "",
+        segments > 0,
+        func.coalesce(evt_counts.c.events, 0) > 0,
+    ))
+    return db.execute(
+        select(
+            cal.c.day,
+            has_input.label('has_input'),
+            and_(has_log, logs.c.sleepiness.is_(None)).label('missing_sleepiness'),
+            and_(has_log, logs.c.toilet_count.is_(None)).label('missing_toilet_count'),
+            and_(has_log, func.coalesce(seg_counts.c.in_bed, 0) == 0).label('missing_in_bed'),
+            and_(has_log, func.coalesce(seg_counts.c.states, 0) == 0).label('missing_segments'),
+        )
+        .select_from(
+            cal.outerjoin(logs, and_(logs.c.user_id == user_id, logs.c.date == cal.c.day))
+            .outerjoin(seg_counts, seg_counts.c.log_id == logs.c.id)
+            .outerjoin(evt_counts, evt_counts.c.log_id == logs.c.id)
+        )
+        .order_by(cal.c.day)
+    ).all()
+
+
+def _segment_row(log_id, segment_type, start_at, end_at):
+    # Core inserts bypass the @validates hooks: derive the minute columns here
+    start_min = hhmm_to_minutes(start_at)
+    end_min = hhmm_to_minutes(end_at)
+    return {
+        'log_id': log_id,
+        'segment_type': segment_type,
+        'start_at': start_at,
+        'end_at': end_at,
+        'start_min': start_min,
+        'end_min': end_min,
+        'crosses_midnight': end_min < start_min if start_min is not None and end_min is not None else None
+    }
+
+
+def _insert_day_batch(conn, user_id, days):
+    logs = SleepLog.__table__
+    log_ids = conn.execute(
+        insert(logs).returning(logs.c.id, sort_by_parameter_order=True),
+        [dict(values, user_id=user_id) for values, _, _ in days]
+    ).scalars().all()
+
+    seg_rows, evt_rows, summary_rows = [], [], []
+    for log_id, (values, segments, events) in zip(log_ids, days):
+        rows = [_segment_row(log_id, *seg) for seg in segments]
+        seg_rows.extend(rows)
+        evt_rows.extend(
+            {'log_id': log_id, 'event_type': e_type, 'happened_at': happened_at,
+             'happened_min': hhmm_to_minutes(happened_at)}
+            for e_type, happened_at in events
+        )
+        summary_rows.append(dict(
+            summarize_day(
+                values.get('sleepiness'),
+                values.get('toilet_count'),
+                [(r['segment_type'], r['start_min'], r['end_min']) for r in rows],
+                [e_type for e_type, _ in events]
+            ),
+            log_id=log_id, user_id=user_id, date=values['date']
+        ))
+
+    # One executemany per table
+    if seg_rows:
+        conn.execute(insert(SleepSegment.__table__), seg_rows)
+    if evt_rows:
+        conn.execute(insert(Event.__table__), evt_rows)
+    conn.execute(insert(DailySummary.__table__), summary_rows)
+
+
+def bulk_insert_days(conn, user_id, days, batch_size=BULK_BATCH_SIZE):
+    """Insert many new days for a user with Core executemany; returns the number of days.
+
+    days: iterable of (values, segments, events) with
+      values: SleepLog column values including 'date'
+      segments / events: same tuples as save_day
+    Log ids come back from INSERT ... RETURNING in parameter order, and the
+    minute columns and daily_summaries rows are filled in the same pass.
+    Runs in the caller's transaction (e.g. engine.begin()); days must not
+    exist yet (see delete_days).
+    """
+    count = 0
+    batch = []
+    for day in days:
+        batch.append(day)
+        if len(batch) >= batch_size:
+            _insert_day_batch(conn, user_id, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        _insert_day_batch(conn, user_id, batch)
+        count += len(batch)
+    return count
+
+
+def _delete_logs(conn, log_ids):
+    # Children first: log_ids is a subquery on sleep_logs
+    for model in (SleepSegment, Event, DailySummary):
+        table = model.__table__
+        conn.execute(delete(table).where(table.c.log_id.in_(log_ids)))
+    logs = SleepLog.__table__
+    return conn.execute(delete(logs).where(logs.c.id.in_(log_ids))).rowcount
+
+
+def delete_days(conn, user_id, start_date, end_date):
+    """Delete a user's logs in [start_date, end_date] with their children (Core, no ORM loads)"""
+    logs = SleepLog.__table__
+    return _delete_logs(conn, select(logs.c.id).where(
+        logs.c.user_id == user_id,
+        logs.c.date >= start_date,
+        logs.c.date <= end_date
+    ))
+
+
+def delete_dates(conn, user_id, dates):
+    """Delete a user's logs on the given dates with their children"""
+    if not dates:
+        return 0
+    logs = SleepLog.__table__
+    return _delete_logs(conn, select(logs.c.id).where(
+        logs.c.user_id == user_id,
+        logs.c.date.in_(list(dates))
+    ))
+
+
+class SleepRepository:
+    """Sleep log access scoped to one user: every read and write filters on user_id.
+
+    app.py builds one per run for the authenticated User, so no page can
+    touch another user's (user_id, date) rows. With a MonthCache, month()/
+    day()/days() serve snapshots from it and commit() invalidates exactly
+    the months this repository saved.
+    """
+
+    def __init__(self, db, user_id, cache=None):
+        if user_id is None:
+            raise ValueError("SleepRepository needs a persisted user id")
+        self.db = db
+        self.user_id = user_id
+        self.cache = cache
+        self._saved_dates = set()
+
+    def logs(self, start_date, end_date):
+        return fetch_logs(self.db, self.user_id, start_date, end_date)
+
+    def statuses(self, start_date, end_date):
+        return day_statuses(self.db, self.user_id, start_date, end_date)
+
+    def get(self, target_date):
+        return get_log(self.db, self.user_id, target_date)
+
+    def get_by_id(self, log_id):
+        """Log by primary key, or None; PermissionError if it belongs to another user"""
+        log = _with_children(self.db.query(SleepLog)).filter(SleepLog.id == log_id).first()
+        if log is not None and log.user_id != self.user_id:
+            raise PermissionError(f"log {log_id} belongs to another user")
+        return log
+
+    def _load_month(self, year, month):
+        start_date, end_date = month_bounds(year, month)
+        return {
+            log.date: snapshot_log(log, log.summary or summarize_log(log))
+            for log in self.logs(start_date, end_date)
+        }
+
+    def month(self, year, month):
+        """{date: DaySnapshot} of one month"""
+        if self.cache is None:
+            return self._load_month(year, month)
+        return self.cache.get(self.user_id, year, month, lambda: self._load_month(year, month))
+
+    def day(self, target_date):
+        """DaySnapshot of a day, or None"""
+        return self.month(target_date.year, target_date.month).get(target_date)
+
+    def days(self, start_date, end_date):
+        """DaySnapshots of [start_date, end_date] in date order"""
+        result = []
+        for year, month in months_between(start_date, end_date):
+            days = self.month(year, month)
+            result.extend(days[d] for d in sorted(days) if start_date <= d <= end_date)
+        return result
+
+    def save(self, target_date, values, segments, events, log=None):
+        if log is not None and log.user_id != self.user_id:
+            raise ValueError(f"log {log.id} belongs to another user")
+        self._saved_dates.add(target_date)
+        return save_day(self.db, self.user_id, target_date, values, segments, events, log=log)
+
+    def commit(self):
+        """Commit the session, then drop cached months of the days saved through this repository"""
+        self.db.commit()
+        if self.cache is not None and self._saved_dates:
+            self.cache.invalidate(self.user_id, self._saved_dates)
+        self._saved_dates.clear()
+
+    def invalidate_cache(self):
+        """Forget every cached month of this user (after writes that bypass save, e.g. imports)"""
+        if self.cache is not None:
+            self.cache.invalidate_user(self.user_id)
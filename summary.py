@@ -0,0 +1,127 @@
+from models import DailySummary
+from intervals import DayIntervals, SLEEP_KINDS, KIND_IN_BED, KIND_AWAKE
+from validation import MISSING_KEYS, required_missing
+
+
+def summarize_day(sleepiness, toilet_count, segments, event_types):
+    """Compute DailySummary column values.
+
+    segments: list of (segment_type, start_min, end_min)
+    event_types: iterable of event_type strings
+    """
+    # Merged coverage per kind: overlapping segments of a stored day are not
+    # counted twice (malformed times are skipped)
+    intervals = DayIntervals.from_segments(segments, strict=False)
+    values = {
+        'total_sleep_min': intervals.coverage(SLEEP_KINDS),
+        'in_bed_min': intervals.coverage((KIND_IN_BED,)),
+        'awake_min': intervals.coverage((KIND_AWAKE,)),
+        'sleep_med_count': 0,
+        'other_med_count': 0,
+        'alcohol_count': 0,
+        'caffeine_count': 0,
+        'bath_count': 0,
+        'toilet_count': 0,
+        'other_event_count': 0,
+    }
+
+    # Same precedence as the calendar badges
+    for e_type in event_types:
+        if "alcohol" in e_type: values['alcohol_count'] += 1
+        elif "sleep_med" in e_type: values['sleep_med_count'] += 1
+        elif "med" in e_type: values['other_med_count'] += 1
+        elif "caffeine" in e_type: values['caffeine_count'] += 1
+        elif "bath" in e_type: values['bath_count'] += 1
+        elif "toilet" in e_type: values['toilet_count'] += 1
+        else: values['other_event_count'] += 1
+
+    # Required fields (spec_validation.md R1-R7, as far as the current model has them)
+    missing = required_missing(sleepiness, toilet_count, segments)
+
+    values['missing_fields'] = ",".join(missing)
+    values['is_complete'] = not missing
+    return values
+
+
+def summarize_log(log):
+    """Transient DailySummary for a log (not attached to the session)"""
+    return DailySummary(
+        user_id=log.user_id,
+        date=log.date,
+        **summarize_day(
+            log.sleepiness,
+            log.toilet_count,
+            [(s.segment_type, s.start_min, s.end_min) for s in log.segments],
+            [e.event_type for e in log.events]
+        )
+    )
+
+
+def refresh_summary(log):
+    """Recompute log.summary in place from log.segments/log.events; flushed with the caller's commit"""
+    values = summarize_day(
+        log.sleepiness,
+        log.toilet_count,
+        [(s.segment_type, s.start_min, s.end_min) for s in log.segments],
+        [e.event_type for e in log.events]
+    )
+    if log.summary is None:
+        log.summary = DailySummary(user_id=log.user_id, date=log.date, **values)
+    else:
+        for key, value in values.items():
+            if getattr(log.summary, key) != value: # Unchanged days stay clean
+                setattr(log.summary, key, value)
+    return log.summary
+
+
+def event_icons(summary):
+    """Calendar badge icons from event counts, grouped by type"""
+    return (
+        "🍺" * summary.alcohol_count
+        + "💊" * (summary.sleep_med_count + summary.other_med_count)
+        + "☕" * summary.caffeine_count
+        + "🛁" * summary.bath_count
+        + "🚽" * summary.toilet_count
+        + "•" * summary.other_event_count
+    )
+
+
+def status_missing(row):
+    """missing_fields keys of a repository.day_statuses row"""
+    return [key for key in MISSING_KEYS if getattr(row, key)]
+
+
+def day_status(row):
+    """'complete' / 'incomplete' / 'none' (calendar status of spec_api.md GET /logs/month)"""
+    if not row.has_input:
+        return 'none'
+    return 'incomplete' if status_missing(row) else 'complete'
+
+
+def period_summary(start_date, end_date, rows):
+    """PDF pre-check n/m/k of [start_date, end_date] (spec_validation.md B, spec_api.md POST /logs/summary)
+
+    rows: repository.day_statuses of the period, one per day in date order
+    """
+    missing_days = []
+    complete_days = []
+    no_input_days = []
+    for row in rows:
+        if not row.has_input:
+            no_input_days.append(row.day.isoformat())
+            continue
+        missing = status_missing(row)
+        if missing:
+            missing_days.append({'date': row.day.isoformat(), 'missing_fields': missing})
+        else:
+            complete_days.append(row.day.isoformat())
+
+    return {
+        'period': {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat()},
+        'n': len(missing_days) + len(complete_days),
+        'm': len(no_input_days),
+        'k': len(missing_days),
+        'missing_days': missing_days,
+        'no_input_days': no_input_days,
+        'complete_days': complete_days,
+    }
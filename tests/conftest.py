@@ -0,0 +1,52 @@
+import os
+import sys
+import tempfile
+from datetime import timedelta
+
+# models.py builds its engine from DATABASE_URL at import time: point it at a
+# throwaway file so nothing here touches sleep_monitor.db
+os.environ['DATABASE_URL'] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="sleep-monitor-tests-"), "app.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from models import Base, User, _configure_sqlite
+from repository import save_day
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """File-backed SQLite engine configured like models.engine, with the current schema"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={'check_same_thread': False})
+    event.listen(engine, "connect", _configure_sqlite)
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    with sessionmaker(bind=engine)() as session:
+        yield session
+
+
+def add_user(db, username):
+    user = User(username=username, email=f"{username}@example.com", password_hash="x", display_name=username)
+    db.add(user)
+    db.commit()
+    return user
+
+
+def seed_days(db, user_id, start_date, days, memo=""):
+    """One full day (In-bed, Deep, Doze segments and two events) per date from start_date"""
+    for offset in range(days):
+        save_day(
+            db, user_id, start_date + timedelta(days=offset),
+            {'sleepiness': 5, 'toilet_count': 1, 'memo': memo},
+            [("In-bed (布団に入っている)", "22:30", "07:00"),
+             ("Deep Sleep (ぐっすり)", "23:00", "03:00"),
+             ("Doze (うとうと)", "03:00", "06:30")],
+            [("sleep_med (睡眠薬)", "22:00"), ("toilet (トイレ)", "03:10")]
+        )
+    db.commit()
@@ -0,0 +1,56 @@
+from contextlib import contextmanager
+from datetime import date, timedelta
+from sqlalchemy import event
+from repository import fetch_logs
+from conftest import add_user, seed_days
+
+WINDOW_START = date(2026, 1, 1)
+WINDOW_DAYS = 121 # The calendar's ±60 days
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def test_fetch_logs_window_is_three_queries(engine, db):
+    user_id = add_user(db, "alice").id
+    seed_days(db, user_id, WINDOW_START, WINDOW_DAYS)
+    db.expunge_all()
+
+    with count_queries(engine) as statements:
+        logs = fetch_logs(db, user_id, WINDOW_START, WINDOW_START + timedelta(days=WINDOW_DAYS - 1))
+        # Everything the calendar / PDF pages touch per day is already loaded
+        for log in logs:
+            assert len(log.segments) == 3
+            assert len(log.events) == 2
+            assert log.summary.total_sleep_min == 450
+
+    assert len(logs) == WINDOW_DAYS
+    # Logs (+ summaries joined), then one SELECT ... IN for segments and one for events
+    assert len(statements) <= 3, statements
+
+
+def test_fetch_logs_query_count_does_not_grow_with_the_window(engine, db):
+    user_id = add_user(db, "alice").id
+    seed_days(db, user_id, WINDOW_START, 365)
+    db.expunge_all()
+
+    counts = []
+    for days in (7, 31, 365):
+        with count_queries(engine) as statements:
+            logs = fetch_logs(db, user_id, WINDOW_START, WINDOW_START + timedelta(days=days - 1))
+            for log in logs:
+                log.segments, log.events
+        counts.append(len(statements))
+        db.expunge_all()
+    assert counts == [counts[0]] * 3
@@ -0,0 +1,70 @@
+import re
+from datetime import date
+from sqlalchemy import event, inspect, text
+from models import SleepLog, SleepSegment, Event
+from repository import fetch_logs
+from migrate_db import create_missing_indexes
+from conftest import add_user, seed_days
+
+INDEXES = {
+    'sleep_logs': 'uq_sleep_logs_user_date',
+    'sleep_segments': 'ix_sleep_segments_log_start',
+    'events': 'ix_events_log_happened',
+}
+
+
+def query_plans(engine, db, user_id):
+    """{table: EXPLAIN QUERY PLAN detail text} of the statements fetch_logs runs"""
+    executed = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fetch_logs(db, user_id, date(2026, 1, 1), date(2026, 1, 31))
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        db.rollback()
+
+    plans = {}
+    with engine.connect() as conn:
+        for statement, parameters in executed:
+            table = re.search(r"\bFROM\s+(\w+)", statement).group(1)
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+            plans[table] = " | ".join(row[-1] for row in rows)
+    return plans
+
+
+def test_range_and_child_queries_use_the_indexes(engine, db):
+    user_id = add_user(db, "alice").id
+    seed_days(db, user_id, date(2025, 12, 1), 90)
+    db.expunge_all()
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+    plans = query_plans(engine, db, user_id)
+    assert set(plans) == set(INDEXES), plans
+    for table, index in INDEXES.items():
+        assert f"INDEX {index}" in plans[table], plans[table]
+
+
+def test_create_missing_indexes_adds_them_to_an_old_database(engine, db):
+    user_id = add_user(db, "alice").id
+    seed_days(db, user_id, date(2026, 1, 1), 31)
+    db.expunge_all()
+    # A database created before the indexes existed
+    with engine.begin() as conn:
+        for index in INDEXES.values():
+            conn.execute(text(f"DROP INDEX {index}"))
+
+    with engine.begin() as conn:
+        create_missing_indexes(conn)
+
+    insp = inspect(engine)
+    for model in (SleepLog, SleepSegment, Event):
+        names = {ix['name'] for ix in insp.get_indexes(model.__tablename__)}
+        assert INDEXES[model.__tablename__] in names
+    plans = query_plans(engine, db, user_id)
+    for table, index in INDEXES.items():
+        assert f"INDEX {index}" in plans[table], plans[table]
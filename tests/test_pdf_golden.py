@@ -0,0 +1,45 @@
+"""Render-and-compare check of the PDF layout against tests/golden/sample_month.png.
+
+The golden image is benchmark.sample_month rendered with invariant=True
+before arrowheads and event markers became form XObjects. Regenerate it
+after an intended layout change with:
+    UPDATE_GOLDEN=1 python -m pytest tests/test_pdf_golden.py
+"""
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from benchmark import sample_month
+from pdf_generator import SleepPDFGenerator
+
+pymupdf = pytest.importorskip("pymupdf") # Rasterizer; not needed by the app itself
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GOLDEN = os.path.join(ROOT, "tests", "golden", "sample_month.png")
+DPI = 150
+# Rasterizer versions may anti-alias edges differently: ignore small shade
+# changes and a few stray pixels (one missing event marker is ~16 pixels)
+PIXEL_TOLERANCE = 64
+MAX_DIFFERENT_PIXELS = 8
+
+
+def render_sample_month():
+    segments, daily_logs, user_info = sample_month()
+    pdf_bytes = SleepPDFGenerator(invariant=True).generate(segments, daily_logs, user_info)
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        assert doc.page_count == 1
+        pix = doc[0].get_pixmap(dpi=DPI, colorspace=pymupdf.csGRAY)
+        return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
+
+def test_sample_month_looks_unchanged(monkeypatch):
+    monkeypatch.chdir(ROOT) # The template is read from assets/ relative to the working directory
+    image = render_sample_month()
+    if os.getenv("UPDATE_GOLDEN"):
+        image.save(GOLDEN)
+    golden = Image.open(GOLDEN)
+    assert image.size == golden.size
+
+    diff = np.abs(np.asarray(image, dtype=np.int16) - np.asarray(golden, dtype=np.int16))
+    different = int((diff > PIXEL_TOLERANCE).sum())
+    assert different <= MAX_DIFFERENT_PIXELS, f"{different} pixels differ from the golden image"
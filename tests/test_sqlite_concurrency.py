@@ -0,0 +1,49 @@
+import threading
+from datetime import date, timedelta
+from sqlalchemy.orm import sessionmaker
+from models import SleepLog
+from repository import save_day
+from conftest import add_user
+
+WRITERS = 8
+DAYS_PER_WRITER = 30
+
+
+def test_journal_mode_is_wal(engine):
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1 # NORMAL
+
+
+def test_concurrent_writers_do_not_hit_database_locked(engine, db):
+    user_ids = [add_user(db, f"writer{i}").id for i in range(WRITERS)]
+    Session = sessionmaker(bind=engine)
+    start = threading.Barrier(WRITERS)
+    errors = []
+
+    def writer(user_id):
+        start.wait() # All threads begin writing at once
+        try:
+            for offset in range(DAYS_PER_WRITER):
+                # One session per save, like one Streamlit rerun per save
+                with Session() as session:
+                    save_day(
+                        session, user_id, date(2026, 1, 1) + timedelta(days=offset),
+                        {'sleepiness': 5, 'toilet_count': 0, 'memo': ""},
+                        [("In-bed (布団に入っている)", "23:00", "07:00"), ("Deep Sleep (ぐっすり)", "23:30", "06:30")],
+                        []
+                    )
+                    session.commit()
+                    # A read between writes, as the calendar does after a save
+                    session.query(SleepLog).filter(SleepLog.user_id == user_id).count()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(user_id,)) for user_id in user_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+    assert db.query(SleepLog).count() == WRITERS * DAYS_PER_WRITER
@@ -0,0 +1,98 @@
+from datetime import date
+import pytest
+from models import SleepLog
+from month_cache import MonthCache
+from repository import SleepRepository
+from conftest import add_user, seed_days
+
+DAY = date(2026, 2, 10)
+
+
+@pytest.fixture
+def repos(db):
+    """(alice, bob) repositories on one session and one month cache, both with February 2026 logged"""
+    alice_id = add_user(db, "alice").id
+    bob_id = add_user(db, "bob").id
+    seed_days(db, alice_id, date(2026, 2, 1), 28, memo="alice")
+    seed_days(db, bob_id, date(2026, 2, 1), 28, memo="bob")
+    cache = MonthCache()
+    return SleepRepository(db, alice_id, cache=cache), SleepRepository(db, bob_id, cache=cache)
+
+
+def test_reads_only_see_own_rows(repos):
+    alice, bob = repos
+    for repo, name in ((alice, "alice"), (bob, "bob")):
+        assert {log.user_id for log in repo.logs(date(2026, 1, 1), date(2026, 3, 31))} == {repo.user_id}
+        assert repo.get(DAY).memo == name
+        # Month cache entries are per user
+        assert {snap.memo for snap in repo.month(2026, 2).values()} == {name}
+        assert {snap.memo for snap in repo.days(date(2026, 2, 1), date(2026, 2, 28))} == {name}
+        assert repo.day(DAY).memo == name
+
+
+def test_statuses_ignore_other_users(db, repos):
+    alice, bob = repos
+    carol = SleepRepository(db, add_user(db, "carol").id)
+    assert not any(row.has_input for row in carol.statuses(date(2026, 2, 1), date(2026, 2, 28)))
+    assert all(row.has_input for row in alice.statuses(date(2026, 2, 1), date(2026, 2, 28)))
+
+
+def test_get_by_id_of_another_users_log_is_forbidden(repos):
+    alice, bob = repos
+    bob_log = bob.get(DAY)
+    assert bob.get_by_id(bob_log.id) is bob_log
+    with pytest.raises(PermissionError):
+        alice.get_by_id(bob_log.id)
+
+
+def test_save_rejects_another_users_log(db, repos):
+    alice, bob = repos
+    bob_log = bob.get(DAY)
+    with pytest.raises(ValueError):
+        alice.save(DAY, {'sleepiness': 1, 'toilet_count': 0, 'memo': "overwritten"}, [], [], log=bob_log)
+    db.rollback()
+    assert bob.get(DAY).memo == "bob"
+
+
+def test_saving_the_same_date_keeps_users_apart(db, repos):
+    alice, bob = repos
+    alice.save(DAY, {'sleepiness': 9, 'toilet_count': 0, 'memo': "alice again"}, [], [])
+    alice.commit()
+
+    assert alice.day(DAY).memo == "alice again"
+    assert bob.day(DAY).memo == "bob" # Alice's commit only invalidates her months
+    assert bob.get(DAY).memo == "bob"
+    assert db.query(SleepLog).filter(SleepLog.date == DAY).count() == 2
+
+
+def test_api_put_on_another_users_log_is_403(db, repos, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    import api
+
+    alice, bob = repos
+    bob_log_id = bob.get(DAY).id
+    config = tmp_path / "auth_config.yaml"
+    config.write_text(
+        "credentials:\n  usernames:\n"
+        "    alice: {email: alice@example.com, name: alice, password: alice-pw}\n"
+        "    bob: {email: bob@example.com, name: bob, password: bob-pw}\n"
+    )
+    monkeypatch.setattr(api, "AUTH_CONFIG", str(config))
+    api.app.dependency_overrides[api.get_db] = lambda: db
+    try:
+        client = TestClient(api.app)
+        body = {'date': DAY.isoformat(), 'sleepiness': 1, 'toilet_count': 0, 'memo': "overwritten"}
+
+        response = client.put(f"/logs/day/{bob_log_id}", json=body, auth=("alice", "alice-pw"))
+        assert response.status_code == 403
+        # Alice's own day of the same date is a different log
+        response = client.get("/logs/day", params={'date': DAY.isoformat()}, auth=("alice", "alice-pw"))
+        assert response.status_code == 200
+        assert response.json()['memo'] == "alice"
+        assert response.json()['id'] != bob_log_id
+        response = client.put(f"/logs/day/{bob_log_id}", json=body, auth=("bob", "bob-pw"))
+        assert response.status_code == 200
+    finally:
+        api.app.dependency_overrides.clear()
+    db.expire_all()
+    assert bob.get(DAY).memo == "overwritten"
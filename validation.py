@@ -0,0 +1,220 @@
+"""Save-time validation of daily input (spec_validation.md A).
+
+validate_day checks one day as the daily-entry page / API holds it;
+validate_days applies the same rules to many days at once with numpy
+(imports, whole months). Both report Issue tuples:
+
+    Issue(key='overlapping_segments', level='error', segments=(0, 2))
+
+segments are indexes into the day's segment list. Levels:
+- 'error': save blocked (E1-E3)
+- 'missing': saved as incomplete, the DailySummary.missing_fields keys (R)
+- 'warning': saved as is (W)
+
+In-bed segments are the envelope the Deep/Doze/Awake states are drawn in,
+so overlap (E1) is checked within each of the two layers, not across them.
+Cross-midnight segments (end < start) are split at midnight onto the
+day's 0-24h axis, the same way the PDF draws them.
+"""
+import textwrap
+from bisect import bisect_right
+from collections import namedtuple
+from models import MINUTES_PER_DAY
+from intervals import IN_BED, STATE, segment_layer, split_midnight
+from pdf_layout import MEMO_WRAP_WIDTH, MEMO_MAX_LINES
+
+ERROR, MISSING, WARNING = 'error', 'missing', 'warning'
+
+# key -> (level, message); also the order issues are reported in
+RULES = {
+    'overlapping_segments': (ERROR, "睡眠区間が重なっています。重なりを解消してください。"), # E1
+    'invalid_duration': (ERROR, "開始と終了の時刻を確認してください。"), # E2
+    'invalid_time': (ERROR, "時刻の形式が不正です。選択し直してください。"), # E3
+    'missing_sleepiness': (MISSING, "眠気（1〜10）が未入力です。"), # R1
+    'missing_toilet_count': (MISSING, "夜間トイレ回数が未入力です。"), # R2
+    'missing_in_bed': (MISSING, "就床時刻が未入力です。"), # R3/R4: the In-bed segment
+    'missing_segments': (MISSING, "睡眠区間が未入力です。"), # R7
+    'segment_outside_in_bed': (WARNING, "睡眠区間が寝床滞在の範囲外です。必要に応じて調整してください。"), # W1
+    'memo_truncated': (WARNING, "特記事項が長いため、PDFでは末尾が省略される可能性があります。"), # W4
+}
+# Required-field keys in DailySummary.missing_fields order
+MISSING_KEYS = tuple(key for key, (level, _) in RULES.items() if level == MISSING)
+
+Issue = namedtuple('Issue', ['key', 'level', 'segments'])
+
+
+def message(issue):
+    return RULES[issue.key][1]
+
+
+def memo_truncated(memo):
+    return bool(memo) and len(textwrap.wrap(memo, width=MEMO_WRAP_WIDTH)) > MEMO_MAX_LINES
+
+
+def required_missing(sleepiness, toilet_count, segments):
+    """missing_fields keys (spec_validation.md R) of a day; segments: (segment_type, start_min, end_min)"""
+    layers = set(
+        segment_layer(s_type) for s_type, start_min, end_min in segments
+        if start_min is not None and end_min is not None
+    )
+    missing = []
+    if sleepiness is None: missing.append('missing_sleepiness')
+    if toilet_count is None: missing.append('missing_toilet_count')
+    if IN_BED not in layers: missing.append('missing_in_bed')
+    if STATE not in layers: missing.append('missing_segments')
+    return missing
+
+
+def _issues(found):
+    """{key: segment indexes} -> Issues in RULES order"""
+    return [Issue(key, RULES[key][0], tuple(sorted(found[key]))) for key in RULES if key in found]
+
+
+def _overlapping(pieces):
+    """Indexes of overlapping pieces (start, end, index): sort, then sweep keeping the furthest end"""
+    overlapping = set()
+    reach_end, reach_index = -1, None
+    for start, end, index in sorted(pieces):
+        if start < reach_end:
+            overlapping.update((reach_index, index))
+        if end > reach_end:
+            reach_end, reach_index = end, index
+    return overlapping
+
+
+def validate_day(sleepiness, toilet_count, segments, memo=""):
+    """Issues of one day, O(n log n) in the segment count.
+
+    segments: (segment_type, start_min, end_min); None minutes are unparseable times
+    """
+    found = {}
+    pieces = {IN_BED: [], STATE: []}
+    for index, (s_type, start_min, end_min) in enumerate(segments):
+        if start_min is None or end_min is None:
+            found.setdefault('invalid_time', set()).add(index)
+            continue
+        if start_min == end_min:
+            # Zero length; HH:MM pairs cannot reach 24h
+            found.setdefault('invalid_duration', set()).add(index)
+            continue
+        layer = segment_layer(s_type)
+        if layer is not None:
+            pieces[layer].extend((start, end, index) for start, end in split_midnight(start_min, end_min))
+
+    overlapping = _overlapping(pieces[IN_BED]) | _overlapping(pieces[STATE])
+    if overlapping:
+        found['overlapping_segments'] = overlapping
+
+    for key in required_missing(sleepiness, toilet_count, segments):
+        found[key] = ()
+
+    if pieces[IN_BED]:
+        # Merge In-bed pieces, then find the merged span each state piece starts in
+        merged = []
+        for start, end, _ in sorted(pieces[IN_BED]):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        starts = [start for start, _ in merged]
+        for start, end, index in pieces[STATE]:
+            i = bisect_right(starts, start) - 1
+            if i < 0 or merged[i][1] < end:
+                found.setdefault('segment_outside_in_bed', set()).add(index)
+
+    if memo_truncated(memo):
+        found['memo_truncated'] = ()
+    return _issues(found)
+
+
+def validate_days(days):
+    """validate_day over many days at once; days: (sleepiness, toilet_count, segments, memo).
+
+    Returns one Issue list per day, equal to validate_day's. Segment checks
+    run as array operations over every segment of every day.
+    """
+    import numpy as np # Deferred like the PDF stack: not needed at app startup
+
+    days = list(days)
+    day_of, seg_of, layer_of, starts, ends = [], [], [], [], []
+    for day_index, (_, _, segments, _) in enumerate(days):
+        for seg_index, (s_type, start_min, end_min) in enumerate(segments):
+            layer = segment_layer(s_type)
+            day_of.append(day_index)
+            seg_of.append(seg_index)
+            layer_of.append(-1 if layer is None else layer)
+            starts.append(-1 if start_min is None else start_min)
+            ends.append(-1 if end_min is None else end_min)
+    day_of, seg_of, layer_of, starts, ends = (
+        np.array(a, dtype=np.int64) for a in (day_of, seg_of, layer_of, starts, ends)
+    )
+    found = [{} for _ in days]
+
+    def mark(key, mask):
+        for day_index, seg_index in zip(day_of[mask].tolist(), seg_of[mask].tolist()):
+            found[day_index].setdefault(key, set()).add(seg_index)
+
+    parsed = (starts >= 0) & (ends >= 0)
+    mark('invalid_time', ~parsed)
+    mark('invalid_duration', parsed & (starts == ends))
+
+    # Midnight split: the evening piece of a wrapping segment ends at 1440,
+    # its morning piece [0, end) is appended (dropped when end is 0:00)
+    usable = np.flatnonzero(parsed & (starts != ends) & (layer_of >= 0))
+    wraps = usable[ends[usable] < starts[usable]]
+    morning = wraps[ends[wraps] > 0]
+    piece_seg = np.concatenate([usable, morning])
+    piece_start = np.concatenate([starts[usable], np.zeros(len(morning), dtype=np.int64)])
+    piece_end = np.concatenate([np.where(ends[usable] < starts[usable], MINUTES_PER_DAY, ends[usable]), ends[morning]])
+    piece_group = day_of[piece_seg] * 2 + layer_of[piece_seg]
+
+    # E1: one sweep over every (day, layer) group. Groups are offset so a
+    # group's pieces start after every end of the groups sorted before it.
+    order = np.lexsort((seg_of[piece_seg], piece_end, piece_start, piece_group))
+    offset = piece_group[order] * (2 * MINUTES_PER_DAY)
+    s = piece_start[order] + offset
+    e = piece_end[order] + offset
+    if len(order):
+        reach = np.maximum.accumulate(e)
+        # Piece holding the furthest end so far (the first one to reach it)
+        new_reach = np.concatenate([[True], e[1:] > reach[:-1]])
+        holder = np.maximum.accumulate(np.where(new_reach, np.arange(len(e)), 0))
+        hit = np.flatnonzero(s[1:] < reach[:-1]) + 1
+        overlapping = np.zeros(len(day_of), dtype=bool)
+        overlapping[piece_seg[order[hit]]] = True
+        overlapping[piece_seg[order[holder[hit - 1]]]] = True
+        mark('overlapping_segments', overlapping)
+
+    # W1: merge the In-bed pieces of every day in one pass (same group
+    # offsets), then look up the merged span each state piece starts in
+    is_in_bed = layer_of[piece_seg] == IN_BED
+    key_start = piece_start + day_of[piece_seg] * (2 * MINUTES_PER_DAY)
+    key_end = piece_end + day_of[piece_seg] * (2 * MINUTES_PER_DAY)
+    bed_order = np.lexsort((key_end[is_in_bed], key_start[is_in_bed]))
+    bed_start = key_start[is_in_bed][bed_order]
+    bed_end = key_end[is_in_bed][bed_order]
+    has_in_bed_piece = np.zeros(len(days), dtype=bool)
+    has_in_bed_piece[day_of[piece_seg[is_in_bed]]] = True
+    state = np.flatnonzero(~is_in_bed & has_in_bed_piece[day_of[piece_seg]])
+    if len(state):
+        bed_reach = np.maximum.accumulate(bed_end)
+        first = np.flatnonzero(np.concatenate([[True], bed_start[1:] > bed_reach[:-1]]))
+        merged_start = bed_start[first]
+        merged_end = np.maximum.reduceat(bed_end, first)
+        i = np.searchsorted(merged_start, key_start[state], side='right') - 1
+        outside = np.zeros(len(day_of), dtype=bool)
+        outside[piece_seg[state[(i < 0) | (merged_end[i] < key_end[state])]]] = True
+        mark('segment_outside_in_bed', outside)
+
+    # R: layers present per day (segments with parseable times)
+    present = np.zeros((len(days), 2), dtype=bool)
+    classified = parsed & (layer_of >= 0)
+    present[day_of[classified], layer_of[classified]] = True
+    for day_index, (sleepiness, toilet_count, _, memo) in enumerate(days):
+        day_found = found[day_index]
+        if sleepiness is None: day_found['missing_sleepiness'] = ()
+        if toilet_count is None: day_found['missing_toilet_count'] = ()
+        if not present[day_index, IN_BED]: day_found['missing_in_bed'] = ()
+        if not present[day_index, STATE]: day_found['missing_segments'] = ()
+        if memo_truncated(memo): day_found['memo_truncated'] = ()
+    return [_issues(day_found) for day_found in found]